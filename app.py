@@ -50,7 +50,9 @@ def main():
         "Summarize",
         "Time Series",
         "3D Spiral View",
+        "Day of Year",
         "Data",
+        "Compare Stations",
         "About NBCN Browser",
     ]
     with st.sidebar:
@@ -58,7 +60,15 @@ def main():
         menu_action = option_menu(
             None,
             menu_options,
-            icons=["table", "graph-up", "badge-3d", "server", "info"],
+            icons=[
+                "table",
+                "graph-up",
+                "badge-3d",
+                "calendar3",
+                "server",
+                "bar-chart-line",
+                "info",
+            ],
             menu_icon="cast",
             default_index=0,
         )
@@ -66,7 +76,7 @@ def main():
     app = NbcnBrowser()
 
     sel_row = pd.DataFrame()
-    if menu_id < (len(menu_options) - 1):
+    if menu_id < (len(menu_options) - 2):
         sel_row = app.get_station()
 
     if len(sel_row) > 0:
@@ -78,9 +88,13 @@ def main():
         elif menu_options.index(menu_action) == 2:
             app.show_spiral(sel_row)
         elif menu_options.index(menu_action) == 3:
+            app.show_day_of_year(sel_row)
+        elif menu_options.index(menu_action) == 4:
             app.get_user_options("data")
             app.show_data(sel_row)
-    elif menu_options.index(menu_action) == 4:
+    elif menu_options.index(menu_action) == 5:
+        app.show_comparison()
+    elif menu_options.index(menu_action) == 6:
         app.show_info()
 
     st.sidebar.markdown(get_info(), unsafe_allow_html=True)
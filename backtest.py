@@ -0,0 +1,144 @@
+"""Rolling-origin backtest of the forecast engines.
+
+    python backtest.py [workers]
+
+For each station, engine (see forecast.py), resolution and cutoff year a
+fold trains on the years up to the cutoff and forecasts the following
+HORIZON years, which are compared with the observed values. Folds run in a
+process pool; fitted forecasters are cached in forecast_cache keyed by the
+fold and the data watermark, so repeated runs only predict. Only the parent
+process writes to the cache.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import forecast
+import forecast_batch
+import forecast_cache
+import rollups
+
+CUTOFFS = [1990, 2000, 2010]
+HORIZON = 10
+RESOLUTIONS = ["Year", "Month"]
+
+
+def run_fold(station, engine, resolution, cutoff, model_json=None):
+    """Fits (or loads) the forecaster of a fold and forecasts the test years.
+
+    Returns:
+        tuple: errors per test period, fold timing and the json of a newly
+               fitted forecaster (None if it was loaded)
+    """
+    field = f"{resolution.lower()}_date"
+    df = rollups.read(resolution.lower(), [station])
+    df = df[df["year"] < datetime.now().year]
+    train = df[df["year"] <= cutoff]
+    test = df[(df["year"] > cutoff) & (df["year"] <= cutoff + HORIZON)]
+    forecaster_class = forecast.FORECASTERS[engine]
+    start = time.perf_counter()
+    if model_json is None:
+        forecaster = forecaster_class().fit(train[field], train["temp_avg"], resolution)
+    else:
+        forecaster = forecaster_class.from_json(model_json)
+    fitted = time.perf_counter()
+    result = forecaster.predict(test[field])
+    errors = pd.DataFrame(
+        {
+            "station": station,
+            "engine": engine,
+            "resolution": resolution,
+            "cutoff": cutoff,
+            "horizon": test["year"].to_numpy() - cutoff,
+            "error": result["yhat"].to_numpy() - test["temp_avg"].to_numpy(),
+        }
+    )
+    timing = {
+        "station": station,
+        "engine": engine,
+        "resolution": resolution,
+        "cutoff": cutoff,
+        "cached": model_json is not None,
+        "fit_s": fitted - start,
+        "predict_s": time.perf_counter() - fitted,
+    }
+    return errors, timing, None if model_json else forecaster.to_json()
+
+
+def run(stations: list, max_workers: int, cutoffs: list = CUTOFFS):
+    """Runs all folds of the stations.
+
+    Returns:
+        tuple: errors of all folds and the timing of each fold
+    """
+    errors, timings = [], []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for station in stations:
+            _, watermark = forecast_batch.station_version(station)
+            for engine in forecast.FORECASTERS:
+                for resolution in RESOLUTIONS:
+                    for cutoff in cutoffs:
+                        fold = [station, engine, resolution, cutoff]
+                        key = forecast_cache.key("backtest", *fold, watermark)
+                        model_json = forecast_cache.cache.load_text(key)
+                        future = executor.submit(run_fold, *fold, model_json)
+                        futures[future] = key
+        for future in as_completed(futures):
+            fold_errors, timing, model_json = future.result()
+            if model_json is not None:
+                forecast_cache.cache.put(
+                    futures[future], "json", lambda path: write_text(path, model_json)
+                )
+            errors.append(fold_errors)
+            timings.append(timing)
+    return pd.concat(errors, ignore_index=True), pd.DataFrame(timings)
+
+
+def write_text(path: str, text: str):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def metrics(errors: pd.DataFrame, by: list) -> pd.DataFrame:
+    """Returns MAE and RMSE of the errors grouped by the columns by."""
+    errors = errors.assign(
+        abs_error=errors["error"].abs(), squared_error=errors["error"] ** 2
+    )
+    result = errors.groupby(by).agg(
+        MAE=("abs_error", "mean"), RMSE=("squared_error", "mean"), n=("error", "size")
+    )
+    result["RMSE"] = np.sqrt(result["RMSE"])
+    return result.reset_index()
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    stations = forecast_batch.stored_stations()
+    start = time.perf_counter()
+    errors, timings = run(stations, workers)
+    wall_s = time.perf_counter() - start
+    keys = ["engine", "resolution"]
+    print("Accuracy per station and horizon [years after the cutoff]")
+    print(metrics(errors, ["station"] + keys + ["horizon"]).to_string(index=False))
+    print("\nAccuracy per engine and resolution")
+    print(metrics(errors, keys).to_string(index=False))
+    print("\nFold timings [s]")
+    print(
+        timings.groupby(keys)
+        .agg(
+            folds=("fit_s", "size"),
+            cached=("cached", "sum"),
+            fit_mean=("fit_s", "mean"),
+            fit_total=("fit_s", "sum"),
+            predict_mean=("predict_s", "mean"),
+        )
+        .reset_index()
+        .to_string(index=False)
+    )
+    print(f"\n{len(timings)} folds, {workers} workers, {wall_s:.2f} s wall-clock")
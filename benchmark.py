@@ -0,0 +1,484 @@
+"""Benchmarks of the data processing steps on synthetic NBCN data.
+
+    python benchmark.py [name ...]
+
+Runs all benchmarks if no name is given, no network access is needed: the
+fetch benchmark serves synthetic NBCN files from a local http server.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import calendar_dim
+import degree_days
+import downsample
+import events
+import fetch
+import forecast
+import rolling
+import rollups
+import spiral
+import store
+import summary
+import swiss_nbcn
+from year_index import YearIndex
+
+NETWORK_SIZE = 29
+# emulated round trip of a request to the MeteoSuisse server
+LATENCY = 0.2
+
+
+def synthetic_station(station="BAS", start="1864-01-01", end="2022-12-31", seed=0):
+    """Returns a daily series with a seasonal cycle, a trend and noise."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, end, freq="D")
+    day = np.arange(len(dates))
+    season = -9 * np.cos(2 * np.pi * dates.dayofyear / 365.25)
+    temp_avg = 9 + season + day / 365.25 * 0.015 + rng.normal(0, 3, len(dates))
+    spread = rng.uniform(2, 6, len(dates))
+    return pd.DataFrame(
+        {
+            "station": station,
+            "date": dates,
+            "temp_avg": temp_avg.astype(np.float32),
+            "temp_min": (temp_avg - spread).astype(np.float32),
+            "temp_max": (temp_avg + spread).astype(np.float32),
+        }
+    )
+
+
+def synthetic_network(size=NETWORK_SIZE):
+    return pd.concat(
+        [synthetic_station(f"S{i:02d}", seed=i) for i in range(size)],
+        ignore_index=True,
+    )
+
+
+def derived_network(size=NETWORK_SIZE):
+    """Returns a synthetic network with the derived columns of the app."""
+    df = synthetic_network(size)
+    calendar = calendar_dim.lookup(
+        calendar_dim.day_key(df["date"]), ["year", "month", "day_of_year"]
+    )
+    for field in calendar.columns:
+        df[field] = calendar[field].to_numpy()
+    for name, column in degree_days.compute(df["temp_avg"]).items():
+        df[name] = column
+    df["station"] = df["station"].astype("category")
+    return df
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    """Returns the best time of repeat calls in seconds and the last result."""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report(title, rows):
+    print(f"\n{title}")
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+def legacy_heat_cold_days(df):
+    # row-wise implementation replaced by degree_days.compute
+    outside_temp = 12
+    room_temp = 20
+    threshold_high = 18.3
+    df["heating_deg_days"] = df.apply(
+        lambda x: room_temp - x["temp_avg"] if x["temp_avg"] < outside_temp else 0,
+        axis=1,
+    )
+    df["heating_days"] = df.apply(
+        lambda x: 1 if x["temp_avg"] < outside_temp else 0, axis=1
+    )
+    df["cooling_days"] = df.apply(
+        lambda x: 1 if x["temp_avg"] > threshold_high else 0, axis=1
+    )
+    return df
+
+
+def bench_degree_days():
+    station = synthetic_station()
+    network = synthetic_network()
+    legacy_s, legacy = timed(legacy_heat_cold_days, station.copy(), repeat=1)
+    station_s, values = timed(degree_days.compute, station["temp_avg"])
+    for name, column in values.items():
+        assert np.allclose(legacy[name], column, atol=1e-4), name
+    network_s, _ = timed(degree_days.compute, network["temp_avg"])
+    all_s, _ = timed(
+        degree_days.compute, network["temp_avg"], list(degree_days.DEFINITIONS)
+    )
+    report(
+        "Degree days",
+        [
+            {"method": "row-wise apply", "rows": len(station), "s": legacy_s},
+            {"method": "vectorized", "rows": len(station), "s": station_s},
+            {"method": "vectorized", "rows": len(network), "s": network_s},
+            {"method": "vectorized, all definitions", "rows": len(network), "s": all_s},
+        ],
+    )
+
+
+def bench_network_summary():
+    daily = derived_network()
+    monthly = rollups.finish(rollups.aggregate(daily, "month"), "month")
+    yearly = rollups.finish(rollups.aggregate(daily, "year"), "year")
+    seconds, result = timed(summary.network_summary, daily, monthly, yearly)
+    report(
+        "Network summary",
+        [{"stations": len(result), "daily rows": len(daily), "s": seconds}],
+    )
+
+
+def bench_year_slice():
+    rows = []
+    for name, df in [("station", synthetic_station()), ("network", derived_network())]:
+        if "year" not in df.columns:
+            df["year"] = df["date"].dt.year.astype(np.int16)
+        df = df.sort_values("year", kind="stable", ignore_index=True)
+        years = [1950, 1980]
+        mask_s, by_mask = timed(
+            lambda: df[(df["year"] >= years[0]) & (df["year"] <= years[1])], repeat=20
+        )
+        index_s, index = timed(YearIndex, df["year"])
+        slice_s, by_slice = timed(index.select, df, years, repeat=20)
+        assert by_mask.equals(by_slice)
+        rows.append(
+            {
+                "data": name,
+                "rows": len(df),
+                "mask s": mask_s,
+                "index build s": index_s,
+                "slice s": slice_s,
+            }
+        )
+    report("Year range selection", rows)
+
+
+def bench_comparison():
+    daily = derived_network()
+    stations = list(daily["station"].cat.categories)
+    rows = []
+    store_dir = store.STORE_DIR
+    with tempfile.TemporaryDirectory() as folder:
+        store.STORE_DIR = folder
+        try:
+            rollups.update(daily, store.VERIFIED, replace=True)
+            for size in [5, 10, NETWORK_SIZE]:
+                for resolution in rollups.RESOLUTIONS:
+                    seconds, result = timed(rollups.read, resolution, stations[:size])
+                    rows.append(
+                        {
+                            "stations": size,
+                            "resolution": resolution,
+                            "rows": len(result),
+                            "s": seconds,
+                        }
+                    )
+        finally:
+            store.STORE_DIR = store_dir
+    report("Station comparison (rollups read from the store)", rows)
+
+
+def pandas_rolling(values, windows):
+    return pd.DataFrame(
+        {
+            rolling.column_name(stat, window): getattr(values.rolling(window), stat)()
+            for window in windows
+            for stat in rolling.STATISTICS
+        }
+    )
+
+
+def bench_rolling():
+    values = synthetic_station()["temp_avg"]
+    windows = rolling.WINDOWS["Day"]
+    pandas_s, expected = timed(pandas_rolling, values, windows)
+    engine_s, result = timed(rolling.compute, values, windows)
+    assert np.allclose(expected, result, atol=1e-3, equal_nan=True)
+    report(
+        "Rolling statistics",
+        [
+            {"method": "pandas rolling()", "rows": len(values), "s": pandas_s},
+            {"method": "rolling.compute", "rows": len(values), "s": engine_s},
+        ],
+    )
+
+
+def bench_events():
+    daily = derived_network()
+    seconds, result = timed(events.detect, daily)
+    row = {"stations": NETWORK_SIZE, "daily rows": len(daily), "s": seconds}
+    for event, yearly in result.items():
+        row[f"{event} years"] = len(yearly)
+    report("Heatwaves, frost spells and tropical nights", [row])
+    assert seconds < 1, "event detection of the network must take less than 1 s"
+
+
+def bench_forecast(holdout_years=10):
+    """Compares the forecast engines on the last holdout_years of a station."""
+    daily = derived_network(1)
+    rows = []
+    for resolution in ["Month", "Year"]:
+        field = f"{resolution.lower()}_date"
+        df = rollups.finish(
+            rollups.aggregate(daily, resolution.lower()), resolution.lower()
+        )
+        split = df["year"].max() - holdout_years
+        train, test = df[df["year"] <= split], df[df["year"] > split]
+        for name, forecaster_class in forecast.FORECASTERS.items():
+            start = time.perf_counter()
+            forecaster = forecaster_class().fit(
+                train[field], train["temp_avg"], resolution
+            )
+            fit_s = time.perf_counter() - start
+            future = forecast.future_dates(
+                train[field].max(), test["year"].max(), resolution
+            )
+            predict_s, result = timed(forecaster.predict, future)
+            error = result["yhat"].to_numpy() - test["temp_avg"].to_numpy()
+            rows.append(
+                {
+                    "engine": name,
+                    "resolution": resolution,
+                    "train rows": len(train),
+                    "fit s": fit_s,
+                    "predict s": predict_s,
+                    "MAE": np.mean(np.abs(error)),
+                    "RMSE": np.sqrt(np.mean(error**2)),
+                }
+            )
+    report(f"Forecast engines, last {holdout_years} years held out", rows)
+
+
+def legacy_spiral(df, min_value):
+    # row-wise implementation replaced by spiral.coordinates
+    df["x"] = 0.0
+    df["y"] = 0.0
+    df["z"] = 0.0
+    for index, row in df.iterrows():
+        theta_radians = 360 / 12 * (row["month"] - 1) * np.pi / 180
+        df.loc[index, "x"] = (row["value"] - min_value) * np.cos(theta_radians)
+        df.loc[index, "y"] = (row["value"] - min_value) * np.sin(theta_radians)
+        df.loc[index, "z"] = row["year"] + (row["month"] - 1) / 12
+    return df
+
+
+def bench_spiral():
+    monthly = rollups.finish(rollups.aggregate(derived_network(1), "month"), "month")
+    df = monthly[["year", "month", "temp_avg"]].rename(columns={"temp_avg": "value"})
+    df = df.astype({"month": np.int64})
+    min_value = np.floor(df["value"].min()) - 0.5
+    legacy_s, legacy = timed(legacy_spiral, df.copy(), min_value, repeat=1)
+    vectorized_s, result = timed(spiral.coordinates, df, "value", min_value)
+    assert np.allclose(legacy[["x", "y", "z"]], result[["x", "y", "z"]])
+    report(
+        "Spiral coordinates",
+        [
+            {"method": "iterrows", "rows": len(df), "s": legacy_s},
+            {"method": "vectorized", "rows": len(df), "s": vectorized_s},
+        ],
+    )
+
+
+def bench_downsample(width=1000):
+    df = synthetic_station()[["date", "temp_avg"]]
+    full_kb = downsample.payload_bytes(df) / 1024
+    rows = [{"method": "none", "rows": len(df), "s": 0.0, "kB": full_kb}]
+    for method in downsample.METHODS[:-1]:
+        seconds, positions = timed(
+            downsample.rows, df, "date", "temp_avg", width, method
+        )
+        sample = df.iloc[positions]
+        if method == "min/max":
+            assert sample["temp_avg"].max() == df["temp_avg"].max()
+        rows.append(
+            {
+                "method": method,
+                "rows": len(sample),
+                "s": seconds,
+                "kB": downsample.payload_bytes(sample) / 1024,
+            }
+        )
+    report(f"Downsampling to {width} points", rows)
+
+
+def nbcn_csv(df: pd.DataFrame) -> bytes:
+    """Returns a station series in the format of the NBCN daily files."""
+    df = pd.DataFrame(
+        {
+            "station/location": df["station"],
+            "date": df["date"].dt.strftime("%Y%m%d"),
+            "tre200d0": df["temp_avg"].round(1),
+            "tre200dn": df["temp_min"].round(1),
+            "tre200dx": df["temp_max"].round(1),
+        }
+    )
+    return df.to_csv(sep=";", index=False, na_rep="-").encode("cp1252")
+
+
+def serve(folder: str, latency: float):
+    """Starts a local http server for the files in folder, returns the server.
+
+    Each request is answered after latency seconds. Files have an ETag and
+    a request with a matching If-None-Match gets 304. The query of a url
+    emulates a failing server: ?fail=<n> answers 503 to the first n requests
+    of the url, ?sleep=<s> waits s more seconds.
+    """
+    requests = {}
+    lock = threading.Lock()
+
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=folder, **kwargs)
+
+        def etag(self):
+            stat = os.stat(self.translate_path(self.path))
+            return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+        def do_GET(self):
+            query = parse_qs(urlsplit(self.path).query)
+            with lock:
+                requests[self.path] = requests.get(self.path, 0) + 1
+                count = requests[self.path]
+            time.sleep(latency + float(query.get("sleep", [0])[0]))
+            if count <= int(query.get("fail", [0])[0]):
+                self.send_error(503)
+            elif self.headers.get("If-None-Match") == self.etag():
+                self.send_response(304)
+                self.send_header("ETag", self.etag())
+                self.end_headers()
+            else:
+                super().do_GET()
+
+        def send_header(self, keyword, value):
+            super().send_header(keyword, value)
+            # sent with the file by SimpleHTTPRequestHandler
+            if keyword == "Last-Modified":
+                super().send_header("ETag", self.etag())
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        def handle_error(self, request, client_address):
+            pass  # clients that timed out have closed the connection
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_fetch(size=NETWORK_SIZE, latency=LATENCY):
+    with tempfile.TemporaryDirectory() as folder:
+        for i in range(size):
+            station = f"S{i:02d}"
+            with open(f"{folder}/{station}.csv", "wb") as f:
+                f.write(nbcn_csv(synthetic_station(station, seed=i)))
+        # a file with an unparsable cell
+        header, first, rest = nbcn_csv(
+            synthetic_station("BAD", end="1864-12-31")
+        ).split(b"\n", 2)
+        first = first.split(b";")
+        first[2] = b"x"
+        with open(f"{folder}/BAD.csv", "wb") as f:
+            f.write(b"\n".join([header, b";".join(first), rest]))
+        server = serve(folder, latency)
+        host, port = server.server_address
+        base = f"http://{host}:{port}"
+        urls = {f"S{i:02d}": f"{base}/S{i:02d}.csv" for i in range(size)}
+        parse = swiss_nbcn.parse_nbcn_csv
+        rows = []
+        for workers in [1, 2, 4, 8, 16]:
+            seconds, (frames, timings) = timed(
+                fetch.fetch_frames, urls, parse, max_workers=workers, repeat=1
+            )
+            assert all(len(df) == len(frames["S00"]) for df in frames.values())
+            assert all(df.attrs["parse_errors"] == 0 for df in frames.values())
+            rows.append(
+                {
+                    "workers": workers,
+                    "files": len(frames),
+                    "MB": timings["bytes"].sum() / 1024**2,
+                    "fetch s (sum)": timings["fetch_s"].sum(),
+                    "parse s (sum)": timings["parse_s"].sum(),
+                    "wall s": seconds,
+                }
+            )
+        report(f"Download from a local http server, {latency} s latency", rows)
+
+        # failure handling, one row per case
+        rows = []
+        seconds, (frames, timings) = timed(
+            fetch.fetch_frames, {"BAD": f"{base}/BAD.csv"}, parse, repeat=1
+        )
+        parse_errors = frames["BAD"].attrs["parse_errors"]
+        assert parse_errors == 1 and np.isnan(frames["BAD"]["temp_avg"].iloc[0])
+        rows.append(
+            {
+                "case": "unparsable cell",
+                "s": seconds,
+                "parse_errors": parse_errors,
+                **timings.iloc[0],
+            }
+        )
+        flaky = {station: f"{url}?fail=2" for station, url in urls.items()}
+        seconds, (frames, timings) = timed(
+            fetch.fetch_frames, flaky, parse, backoff=0.01, repeat=1
+        )
+        assert (timings["attempts"] == 3).all() and timings["modified"].all()
+        rows.append({"case": "2 x 503, retried", "s": seconds, **timings.iloc[0]})
+        validators = {
+            station: {"etag": etag}
+            for station, etag in zip(timings["station"], timings["etag"])
+        }
+        seconds, (frames, timings) = timed(
+            fetch.fetch_frames, urls, parse, validators=validators, repeat=1
+        )
+        assert not timings["modified"].any() and (timings["bytes"] == 0).all()
+        assert all(df is None for df in frames.values())
+        rows.append({"case": "304 not modified", "s": seconds, **timings.iloc[0]})
+        slow = {"S00": f"{urls['S00']}?sleep=0.5"}
+        start = time.perf_counter()
+        try:
+            fetch.fetch_frames(slow, parse, timeout=0.2, retries=1, backoff=0.01)
+            raise AssertionError("the request did not time out")
+        except (urllib.error.URLError, TimeoutError):
+            pass
+        rows.append({"case": "timeout", "s": time.perf_counter() - start})
+        server.shutdown()
+    columns = ["case", "attempts", "modified", "bytes", "parse_errors", "s"]
+    report(
+        "Failure handling", pd.DataFrame(rows).reindex(columns=columns).convert_dtypes()
+    )
+
+
+BENCHMARKS = {
+    "degree_days": bench_degree_days,
+    "network_summary": bench_network_summary,
+    "year_slice": bench_year_slice,
+    "comparison": bench_comparison,
+    "rolling": bench_rolling,
+    "events": bench_events,
+    "forecast": bench_forecast,
+    "spiral": bench_spiral,
+    "downsample": bench_downsample,
+    "fetch": bench_fetch,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,81 @@
+"""Calendar dimension table shared by the station data and the forecasts.
+
+Days are identified by an integer day key, the number of days since EPOCH.
+The calendar holds one row per day from EPOCH to END with the time columns
+used in the app; row i belongs to day key i, so adding time columns to data
+is a gather by integer index instead of building datetimes per row.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+FIRST_YEAR = 1860
+LAST_YEAR = 2200
+EPOCH = np.datetime64(f"{FIRST_YEAR}-01-01", "D")
+END = np.datetime64(f"{LAST_YEAR}-12-31", "D")
+# meteorological seasons by month
+SEASONS = ["winter"] * 2 + ["spring"] * 3 + ["summer"] * 3 + ["autumn"] * 3
+SEASONS += ["winter"]
+
+
+def day_key(dates) -> np.ndarray:
+    """Converts dates (datetime64 values or a Series) to days since EPOCH."""
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    return (dates - EPOCH).astype(np.int64)
+
+
+def key_to_date(key):
+    return EPOCH + np.asarray(key, dtype="timedelta64[D]")
+
+
+def parse_yyyymmdd(values) -> np.ndarray:
+    """Converts integer dates in the NBCN format yyyymmdd to day keys."""
+    values = np.asarray(values, dtype=np.int64)
+    years = (values // 10000 - 1970).astype("datetime64[Y]")
+    months = (values // 100 % 100 - 1).astype("timedelta64[M]")
+    days = (values % 100 - 1).astype("timedelta64[D]")
+    return day_key((years + months).astype("datetime64[D]") + days)
+
+
+def month_key(years, months) -> np.ndarray:
+    """Returns the day keys of the first day of the given months."""
+    years = np.asarray(years, dtype=np.int64)
+    months = np.asarray(months, dtype=np.int64)
+    first = (years - 1970).astype("datetime64[Y]") + (months - 1).astype(
+        "timedelta64[M]"
+    )
+    return day_key(first)
+
+
+@lru_cache(maxsize=1)
+def get_calendar() -> pd.DataFrame:
+    dates = pd.DatetimeIndex(np.arange(EPOCH, END + 1).astype("datetime64[ns]"))
+    year = dates.year.to_numpy()
+    month = dates.month.to_numpy()
+    df = pd.DataFrame(
+        {
+            "date": dates,
+            "year": year.astype(np.int16),
+            "month": month.astype(np.int8),
+            "day_of_year": dates.dayofyear.to_numpy().astype(np.int16),
+            # mid-month and mid-year dates used as x values of aggregated data
+            "month_date": key_to_date(month_key(year, month) + 14).astype(
+                "datetime64[ns]"
+            ),
+            "year_date": key_to_date(month_key(year, 7) + 14).astype(
+                "datetime64[ns]"
+            ),
+            "season": pd.Categorical(
+                np.array(SEASONS)[month - 1],
+                categories=["winter", "spring", "summer", "autumn"],
+            ),
+            "decade": (year // 10 * 10).astype(np.int16),
+        }
+    )
+    return df
+
+
+def lookup(keys, columns: list) -> pd.DataFrame:
+    """Returns the calendar columns for the given day keys."""
+    return get_calendar()[columns].take(np.asarray(keys)).reset_index(drop=True)
@@ -0,0 +1,127 @@
+"""Climate normals of a reference period and anomalies from them.
+
+Normals are the average of a parameter per calendar month or day of year
+over the years of a reference period. They are returned as a frame indexed
+by month (1-12) or day of year (1-366), so the normal of every row of a
+series is gathered by position and anomalies are a vectorized difference.
+
+The day of year climatology describes the distribution of a parameter per
+calendar day (min, max, percentiles and mean) over all years, pooling the
+values of the days within +/- smoothing days.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+START_INDUSTRIAL_PERIOD = 1900
+# reference periods: name -> (first year, last year), None = open start
+PERIODS = {
+    f"pre-industrial (< {START_INDUSTRIAL_PERIOD})": (
+        None,
+        START_INDUSTRIAL_PERIOD - 1,
+    ),
+    "WMO 1961-1990": (1961, 1990),
+    "WMO 1991-2020": (1991, 2020),
+}
+PARAMETERS = [
+    "temp_avg",
+    "temp_min",
+    "temp_max",
+    "heating_deg_days",
+    "heating_days",
+    "cooling_days",
+]
+# monthly extremes in the rollups, not means of daily values (see rollups.py)
+MONTHLY_EXTREMES = ["temp_min", "temp_max"]
+KEYS = {"month": range(1, 13), "day_of_year": range(1, 367)}
+QUANTILES = {"p10": 0.1, "p50": 0.5, "p90": 0.9}
+BANDS = ["min"] + list(QUANTILES) + ["max", "mean"]
+
+
+def in_period(years: pd.Series, period: tuple) -> pd.Series:
+    first, last = period
+    if first is None:
+        return years <= last
+    return (years >= first) & (years <= last)
+
+
+def normals(df: pd.DataFrame, period: tuple, key: str = "month") -> pd.DataFrame:
+    """Returns the climate normals of all parameters in df.
+
+    Args:
+        df (pd.DataFrame): monthly aggregates (key="month") or daily data
+                           (key="day_of_year") of a station
+        period (tuple): first and last year of the reference period
+        key (str): month or day_of_year
+
+    Returns:
+        pd.DataFrame: mean per month or day of year, NaN where the period
+                      has no data. Monthly normals have no temp_min and
+                      temp_max: the monthly aggregates hold the extremes of
+                      the month, whose mean is not the normal of the daily
+                      minimum and maximum.
+    """
+    parameters = [par for par in PARAMETERS if par in df.columns]
+    if key == "month":
+        parameters = [par for par in parameters if par not in MONTHLY_EXTREMES]
+    df = df.loc[in_period(df["year"], period), [key] + parameters]
+    return df.groupby(key)[parameters].mean().reindex(KEYS[key])
+
+
+def anomalies(df: pd.DataFrame, normals: pd.DataFrame, key: str = "month"):
+    """Returns df with a column <parameter>_anomaly for each parameter of
+    normals, the difference of the value and the normal of its month or
+    day of year."""
+    parameters = [par for par in normals.columns if par in df.columns]
+    position = df[key].to_numpy(dtype=np.int64) - normals.index[0]
+    reference = normals[parameters].to_numpy()[position]
+    values = df[parameters].to_numpy(dtype=np.float64) - reference
+    result = df.copy()
+    for i, par in enumerate(parameters):
+        result[f"{par}_anomaly"] = values[:, i]
+    return result
+
+
+def day_of_year_matrix(df: pd.DataFrame, parameter: str) -> np.ndarray:
+    """Returns the values of a parameter as a matrix with one row per year
+    and one column per day of year, NaN where there is no value."""
+    years = df["year"].to_numpy(dtype=np.int64)
+    first = years.min()
+    matrix = np.full((years.max() - first + 1, 366), np.nan)
+    days = df["day_of_year"].to_numpy(dtype=np.int64) - 1
+    matrix[years - first, days] = df[parameter].to_numpy(dtype=np.float64)
+    return matrix
+
+
+def climatology(df: pd.DataFrame, parameter: str, smoothing: int = 0):
+    """Returns the day of year climatology of a parameter.
+
+    Args:
+        df (pd.DataFrame): daily data with year and day_of_year
+        parameter (str): column to describe
+        smoothing (int): days before and after each day of year pooled with
+                         it, the window wraps around the end of the year
+
+    Returns:
+        pd.DataFrame: min, p10, p50, p90, max and mean per day of year
+                      (index 1-366)
+    """
+    matrix = day_of_year_matrix(df, parameter)
+    # pool shifted copies of the matrix, all days are reduced at once
+    shifts = range(-smoothing, smoothing + 1)
+    pooled = np.concatenate([np.roll(matrix, shift, axis=1) for shift in shifts])
+    with warnings.catch_warnings():
+        # days without any value are NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        quantiles = np.nanquantile(pooled, list(QUANTILES.values()), axis=0)
+        result = pd.DataFrame(
+            {
+                "min": np.nanmin(pooled, axis=0),
+                **dict(zip(QUANTILES, quantiles)),
+                "max": np.nanmax(pooled, axis=0),
+                "mean": np.nanmean(pooled, axis=0),
+            },
+            index=pd.Index(KEYS["day_of_year"], name="day_of_year"),
+        )
+    return result.astype(np.float32)
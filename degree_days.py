@@ -0,0 +1,60 @@
+"""Degree day and threshold day definitions.
+
+A definition counts days below or above a threshold of the daily average
+temperature (kind "days"), or sums the difference to a base temperature on
+those days (kind "degree_days"). All definitions are evaluated together on
+the temp_avg array by broadcasting it against the threshold vector.
+
+https://www.meteoschweiz.admin.ch/wetter/wetter-und-klima-von-a-bis-z/kuehltag.html
+https://www.meteoschweiz.admin.ch/wetter/wetter-und-klima-von-a-bis-z.html
+"""
+import numpy as np
+
+DEFINITIONS = {
+    # room temperature 20°C, heating below an outside temperature of 12°C
+    "heating_deg_days": {
+        "kind": "degree_days",
+        "threshold": 12,
+        "base": 20,
+        "below": True,
+    },
+    "heating_days": {"kind": "days", "threshold": 12, "below": True},
+    "cooling_days": {"kind": "days", "threshold": 18.3, "below": False},
+    # todo: find out official definition
+    "cooling_deg_days": {
+        "kind": "degree_days",
+        "threshold": 18.3,
+        "base": 18.3,
+        "below": False,
+    },
+}
+# definitions added as columns to the station data
+COLUMNS = ["heating_deg_days", "heating_days", "cooling_days"]
+
+
+def compute(temp_avg, names: list = COLUMNS) -> dict:
+    """Evaluates the named definitions for an array of daily averages.
+
+    Days with a missing average count as 0.
+
+    Args:
+        temp_avg (array-like): daily average temperatures
+        names (list): keys of DEFINITIONS to evaluate
+
+    Returns:
+        dict: name -> float32 array of the same length as temp_avg
+    """
+    temp = np.asarray(temp_avg, dtype=np.float32)
+    definitions = [DEFINITIONS[name] for name in names]
+    threshold = np.array([d["threshold"] for d in definitions], np.float32)[:, None]
+    base = np.array([d.get("base", 0) for d in definitions], np.float32)[:, None]
+    below = np.array([d["below"] for d in definitions])[:, None]
+    is_degree_days = np.array([d["kind"] == "degree_days" for d in definitions])
+
+    # one row per definition
+    active = np.where(below, temp < threshold, temp > threshold)
+    degrees = np.where(below, base - temp, temp - base)
+    values = np.where(
+        is_degree_days[:, None], np.where(active, degrees, 0), active
+    ).astype(np.float32)
+    return dict(zip(names, values))
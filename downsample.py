@@ -0,0 +1,93 @@
+"""Downsampling of long series before they are sent to the browser.
+
+Altair embeds the chart data as json in the page, so a daily series of 150
+years is several megabytes. A chart cannot show more points than it has
+pixels, so series are reduced to about one point per pixel of the chart
+width; shorter series are kept as they are.
+
+- min/max: the minimum and maximum of equal buckets of rows, extremes stay
+  visible
+- LTTB: Largest-Triangle-Three-Buckets, the point of each bucket forming the
+  largest triangle with its neighbours, keeps the visual shape
+"""
+import numpy as np
+import pandas as pd
+
+METHODS = ["min/max", "LTTB", "none"]
+
+
+def min_max(values, points: int) -> np.ndarray:
+    """Returns the positions of the min and max of points / 2 buckets and
+    of the first and last value."""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    buckets = max(points // 2, 1)
+    size = -(-n // buckets)
+    padding = size * buckets - n
+    low = np.append(np.where(np.isnan(values), np.inf, values), [np.inf] * padding)
+    high = np.append(np.where(np.isnan(values), -np.inf, values), [-np.inf] * padding)
+    offsets = np.arange(buckets) * size
+    positions = np.concatenate(
+        [
+            np.argmin(low.reshape(buckets, size), axis=1) + offsets,
+            np.argmax(high.reshape(buckets, size), axis=1) + offsets,
+        ]
+    )
+    # first and last row keep the extent of the series
+    return np.unique(np.append(positions[positions < n], [0, n - 1]))
+
+
+def lttb(x, y, points: int) -> np.ndarray:
+    """Returns the positions of the points selected by LTTB."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    # first and last point are kept, the others are split into buckets
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    selected = np.zeros(points, dtype=np.int64)
+    selected[-1] = n - 1
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        a = selected[i]
+        # average of the next bucket, the previous point if it has no values
+        next_y = y[end:next_end]
+        next_y = next_y[~np.isnan(next_y)]
+        c_x = np.mean(x[end:next_end])
+        c_y = next_y.mean() if len(next_y) > 0 else y[a]
+        area = np.abs(
+            (x[a] - c_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (c_y - y[a])
+        )
+        area = np.where(np.isnan(area), -1, area)
+        selected[i + 1] = start + np.argmax(area)
+    return selected
+
+
+def rows(df: pd.DataFrame, x: str, y: str, points: int, method: str):
+    """Returns the positions of the rows of df to plot.
+
+    Args:
+        df (pd.DataFrame): series sorted by x
+        x (str): time column
+        y (str): value column
+        points (int): number of points to keep, about the chart width
+        method (str): one of METHODS
+
+    Returns:
+        np.ndarray: row positions, all rows if df has at most points rows
+    """
+    if method == "none" or len(df) <= points:
+        return np.arange(len(df))
+    if method == "LTTB":
+        time = df[x].to_numpy(dtype="datetime64[s]").astype(np.float64)
+        return lttb(time, df[y], points)
+    return min_max(df[y], points)
+
+
+def payload_bytes(df: pd.DataFrame, rows=None) -> int:
+    """Returns the size of df as embedded in the chart (json records),
+    extrapolated from the given row positions if rows is not None."""
+    if rows is None or len(rows) == 0:
+        return len(df.to_json(orient="records", date_format="iso"))
+    sample = df.iloc[rows].to_json(orient="records", date_format="iso")
+    return int(len(sample) / len(rows) * len(df))
@@ -0,0 +1,100 @@
+"""Heatwaves, frost spells and tropical nights of all stations in one pass.
+
+An event is a run of consecutive days on which a daily value is above or
+below a threshold. Runs are found by run-length encoding the condition over
+the daily data of all stations at once: a run starts on an active day whose
+previous row is inactive, of another station or not the previous day, so
+runs never span stations or gaps in the data.
+
+https://www.meteoswiss.admin.ch/weather/weather-and-climate-from-a-to-z/heat-wave.html
+"""
+import numpy as np
+import pandas as pd
+
+import calendar_dim
+
+EVENTS = {
+    # days with a maximum of 30°C or more (hot days) in a row
+    "heatwave": {
+        "column": "temp_max",
+        "threshold": 30,
+        "above": True,
+        "min_days": 3,
+    },
+    # days with a minimum below 0°C (frost days) in a row
+    "frost_spell": {
+        "column": "temp_min",
+        "threshold": 0,
+        "above": False,
+        "min_days": 5,
+    },
+    # nights with a minimum of 20°C or more
+    "tropical_night": {
+        "column": "temp_min",
+        "threshold": 20,
+        "above": True,
+        "min_days": 1,
+    },
+}
+
+
+def runs(daily: pd.DataFrame, event: str) -> pd.DataFrame:
+    """Returns the runs of an event.
+
+    Args:
+        daily (pd.DataFrame): station, date and the event column, sorted by
+                              station and date
+        event (str): key of EVENTS
+
+    Returns:
+        pd.DataFrame: station, year (of the first day), start, end and days
+                      of each run of at least min_days days
+    """
+    definition = EVENTS[event]
+    values = daily[definition["column"]].to_numpy(dtype=np.float32)
+    if definition["above"]:
+        active = values >= definition["threshold"]
+    else:
+        active = values < definition["threshold"]
+    keys = calendar_dim.day_key(daily["date"])
+    station = daily["station"].astype("category")
+    stations = station.cat.codes.to_numpy()
+    continues = np.zeros(len(values), dtype=bool)
+    continues[1:] = (
+        active[:-1] & (keys[1:] == keys[:-1] + 1) & (stations[1:] == stations[:-1])
+    )
+    starts = np.flatnonzero(active & ~continues)
+    # rows of a run are contiguous, its length is the number of active rows
+    # up to the start of the next run
+    run_id = np.cumsum(active & ~continues)[active] - 1
+    days = np.bincount(run_id, minlength=len(starts))
+    keep = days >= definition["min_days"]
+    starts, days = starts[keep], days[keep]
+    dates = daily["date"].to_numpy()
+    result = pd.DataFrame(
+        {
+            "station": station.iloc[starts].to_numpy(),
+            "start": dates[starts],
+            "end": dates[starts + days - 1],
+            "days": days.astype(np.int32),
+        }
+    )
+    result.insert(1, "year", result["start"].dt.year.astype(np.int16))
+    return result
+
+
+def yearly(runs: pd.DataFrame) -> pd.DataFrame:
+    """Returns the number of events, the days in events and the longest
+    event with its dates per station and year."""
+    g = runs.groupby(["station", "year"], observed=True)
+    result = pd.DataFrame({"events": g["days"].size(), "event_days": g["days"].sum()})
+    longest = runs.loc[g["days"].idxmax().to_numpy(), ["days", "start", "end"]]
+    longest.index = result.index
+    longest.columns = ["longest_days", "longest_start", "longest_end"]
+    return pd.concat([result, longest], axis=1).reset_index()
+
+
+def detect(daily: pd.DataFrame, events: list = list(EVENTS)) -> dict:
+    """Returns event -> yearly statistics (see yearly) for all stations in
+    daily, sorted by station and date."""
+    return {event: yearly(runs(daily, event)) for event in events}
@@ -0,0 +1,251 @@
+"""Concurrent download of the MeteoSuisse NBCN csv files.
+
+The station files are independent, so they are fetched by a bounded thread
+pool instead of one after the other. Each request has its own timeout and is
+retried with exponential backoff on network errors. Any http(s) or file url
+works, so the pool can be pointed at a local http server serving synthetic
+NBCN files.
+
+If validators (ETag/Last-Modified of an earlier download) are passed for a
+url, a conditional request is sent and an unchanged file is not downloaded
+again.
+
+With a time to live, responses go through the persistent http_cache: fresh
+entries are served from disk, expired entries are revalidated, and if the
+source is unreachable the stale entry is served.
+"""
+import itertools
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+import http_cache
+
+MAX_WORKERS = 8
+TIMEOUT = 30  # seconds per request
+RETRIES = 3
+BACKOFF = 0.5  # seconds, doubled after each failed attempt
+
+
+def get_validators(headers) -> dict:
+    """Returns the cache validators of a response, empty values are omitted."""
+    result = {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+    }
+    return {key: value for key, value in result.items() if value}
+
+
+def fetch_url(
+    url: str, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF, validators={}
+):
+    """Downloads url and returns its content.
+
+    Args:
+        url (str): http(s) or file url
+        timeout (float): timeout in seconds for a single attempt
+        retries (int): number of retries after the first attempt
+        backoff (float): wait time before the first retry, doubled afterwards
+        validators (dict): etag and/or last_modified of a previous download
+
+    Returns:
+        tuple: content (bytes, None if not modified), number of attempts (int),
+               validators of the response (dict)
+    """
+    request = urllib.request.Request(url)
+    if "etag" in validators:
+        request.add_header("If-None-Match", validators["etag"])
+    if "last_modified" in validators:
+        request.add_header("If-Modified-Since", validators["last_modified"])
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.read(), attempt, get_validators(response.headers)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None, attempt, get_validators(e.headers) or validators
+            # client errors will not go away by asking again
+            if e.code < 500 or attempt > retries:
+                raise
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            if attempt > retries:
+                raise
+        time.sleep(backoff * 2 ** (attempt - 1))
+
+
+def fetch_cached(
+    url: str,
+    ttl: float,
+    timeout=TIMEOUT,
+    retries=RETRIES,
+    backoff=BACKOFF,
+    validators={},
+):
+    """Returns the content of url from the response cache or the network.
+
+    Args:
+        url (str): http(s) or file url
+        ttl (float): time to live of the cached response in seconds
+        validators (dict): sha256 of the content the caller already has
+
+    Returns:
+        tuple: content (bytes, None if it has the caller's sha256), number of
+               attempts (int), validators of the cached response (dict),
+               cache status (str): hit, miss, revalidated or stale
+    """
+    cache = http_cache.cache
+    entry = cache.lookup(url)
+    attempts = 0
+    if entry is not None and cache.is_fresh(entry, ttl):
+        status = "hit"
+    elif http_cache.OFFLINE:
+        raise ConnectionError(f"{url} is not cached and the cache is offline")
+    else:
+        try:
+            content, attempts, response_validators = fetch_url(
+                url, timeout, retries, backoff, {} if entry is None else entry
+            )
+            if content is None:
+                cache.revalidate(url)
+                status = "revalidated"
+            else:
+                entry = cache.put(url, content, response_validators)
+                status = "miss"
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            if entry is None:
+                raise
+            status = "stale"
+    if validators.get("sha256") == entry["sha256"]:
+        content = None
+    elif status != "miss":
+        content = cache.read(entry)
+        if content is None:
+            # evicted by a concurrent put since the lookup
+            return fetch_cached(url, ttl, timeout, retries, backoff, validators)
+    if status != "miss":
+        cache.count(url, status, 0 if content is None else len(content))
+    entry_validators = {
+        key: entry[key] for key in ["etag", "last_modified", "sha256"] if key in entry
+    }
+    return content, attempts, entry_validators, status
+
+
+def fetch_station(station, url, parse, timeout, retries, backoff, validators, ttl):
+    """Downloads and parses the file of a station.
+
+    Returns:
+        tuple: station, DataFrame (None if not modified), timing (dict)
+    """
+    start = time.perf_counter()
+    if ttl is None:
+        content, attempts, response_validators = fetch_url(
+            url, timeout, retries, backoff, validators
+        )
+        cache_status = "none"
+    else:
+        content, attempts, response_validators, cache_status = fetch_cached(
+            url, ttl, timeout, retries, backoff, validators
+        )
+    fetched = time.perf_counter()
+    df = None if content is None else parse(content)
+    parsed = time.perf_counter()
+    timing = {
+        "station": station,
+        "url": url,
+        "modified": content is not None,
+        "bytes": 0 if content is None else len(content),
+        "attempts": attempts,
+        "cache": cache_status,
+        "fetch_s": fetched - start,
+        "parse_s": parsed - fetched,
+        "etag": response_validators.get("etag"),
+        "last_modified": response_validators.get("last_modified"),
+        "sha256": response_validators.get("sha256"),
+    }
+    return station, df, timing
+
+
+def iter_frames(
+    urls: dict,
+    parse,
+    max_workers=None,
+    timeout=TIMEOUT,
+    retries=RETRIES,
+    backoff=BACKOFF,
+    validators={},
+    ttl=None,
+):
+    """Yields (station, DataFrame, timing) as soon as a station is parsed.
+
+    At most max_workers stations are downloaded or waiting to be consumed at
+    any time, so memory is bounded by the consumer and not by the number of
+    stations. Arguments are the same as for fetch_frames.
+    """
+    if max_workers is None:
+        max_workers = MAX_WORKERS
+    items = iter(urls.items())
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+
+        def submit(item):
+            station, url = item
+            return pool.submit(
+                fetch_station,
+                station,
+                url,
+                parse,
+                timeout,
+                retries,
+                backoff,
+                validators.get(station, {}),
+                ttl,
+            )
+
+        pending = {submit(item) for item in itertools.islice(items, max_workers)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                item = next(items, None)
+                if item is not None:
+                    pending.add(submit(item))
+
+
+def fetch_frames(
+    urls: dict,
+    parse,
+    max_workers=None,
+    timeout=TIMEOUT,
+    retries=RETRIES,
+    backoff=BACKOFF,
+    validators={},
+    ttl=None,
+):
+    """Downloads and parses a file per station using a thread pool.
+
+    Args:
+        urls (dict): station id -> url
+        parse (callable): converts the downloaded bytes into a DataFrame
+        max_workers (int): maximum number of concurrent downloads,
+                           MAX_WORKERS if None
+        validators (dict): station id -> validators of the previous download
+        ttl (float): time to live in the response cache, no caching if None
+
+    Returns:
+        tuple: dict station id -> DataFrame (None if not modified) in the
+               order of urls, DataFrame with fetch and parse timings and the
+               response validators per station
+    """
+    results = {
+        station: (df, timing)
+        for station, df, timing in iter_frames(
+            urls, parse, max_workers, timeout, retries, backoff, validators, ttl
+        )
+    }
+    frames = {station: results[station][0] for station in urls}
+    timings = pd.DataFrame([results[station][1] for station in urls])
+    return frames, timings
@@ -0,0 +1,146 @@
+"""Forecast engines for the temperature series.
+
+A forecaster is fitted on the series at the selected time resolution (ds,
+y) and predicts yhat with an 80% interval (yhat_lower, yhat_upper) for
+future dates. Engines:
+
+- Prophet: the Prophet model, seconds per fit
+- Harmonic: linear trend plus annual harmonics solved by least squares,
+  milliseconds per fit
+
+Fitted forecasters are serialized to json, so they can be cached (see
+forecast_cache.py).
+"""
+import json
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+from prophet.serialize import model_from_json, model_to_json
+
+import calendar_dim
+
+# z value of the 80% interval, the default interval width of Prophet
+Z_80 = 1.2816
+DAYS_PER_YEAR = 365.25
+ORIGIN = np.datetime64("2000-01-01")
+
+
+def future_dates(last_date, end_year: int, resolution: str) -> pd.Series:
+    """Returns the dates after last_date up to the end of end_year, using
+    the mid-month and mid-year dates of the calendar for aggregated data."""
+    last_date = pd.Timestamp(last_date)
+    if resolution == "Day":
+        dates = pd.date_range(last_date + pd.Timedelta(days=1), f"{end_year}-12-31")
+        return pd.Series(dates, name="ds")
+    if resolution == "Month":
+        months = np.arange(last_date.year * 12 + last_date.month, end_year * 12 + 12)
+        keys = calendar_dim.month_key(months // 12, months % 12 + 1)
+        field = "month_date"
+    else:
+        keys = calendar_dim.month_key(np.arange(last_date.year + 1, end_year + 1), 7)
+        field = "year_date"
+    return calendar_dim.lookup(keys, [field])[field].rename("ds")
+
+
+class Forecaster(ABC):
+    """Interface of the forecast engines."""
+
+    @abstractmethod
+    def fit(self, ds: pd.Series, y: pd.Series, resolution: str):
+        """Fits the engine to the values y at the dates ds, returns self."""
+
+    @abstractmethod
+    def predict(self, ds: pd.Series) -> pd.DataFrame:
+        """Returns ds, yhat, yhat_lower and yhat_upper for the dates ds."""
+
+    @abstractmethod
+    def to_json(self) -> str:
+        pass
+
+    @classmethod
+    @abstractmethod
+    def from_json(cls, text: str):
+        pass
+
+
+class ProphetForecaster(Forecaster):
+    def fit(self, ds, y, resolution):
+        # yearly data has no seasonality
+        self.model = Prophet(yearly_seasonality=resolution != "Year")
+        self.model.fit(pd.DataFrame({"ds": ds.to_numpy(), "y": y.to_numpy()}))
+        return self
+
+    def predict(self, ds):
+        forecast = self.model.predict(pd.DataFrame({"ds": ds.to_numpy()}))
+        return forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]]
+
+    def to_json(self):
+        return model_to_json(self.model)
+
+    @classmethod
+    def from_json(cls, text):
+        forecaster = cls()
+        forecaster.model = model_from_json(text)
+        return forecaster
+
+
+class HarmonicForecaster(Forecaster):
+    """Linear trend plus harmonics of the annual cycle:
+
+    y = a + b t + sum_k (c_k sin(2 pi k t) + d_k cos(2 pi k t)), t in years
+    """
+
+    def __init__(self, harmonics: int = 3):
+        self.harmonics = harmonics
+
+    def design(self, ds) -> np.ndarray:
+        dates = np.asarray(ds, dtype="datetime64[D]")
+        t = (dates - ORIGIN).astype(np.float64) / DAYS_PER_YEAR
+        k = np.arange(1, self.harmonics + 1)
+        angle = 2 * np.pi * t[:, None] * k
+        return np.column_stack([np.ones_like(t), t, np.sin(angle), np.cos(angle)])
+
+    def fit(self, ds, y, resolution):
+        if resolution == "Year":
+            # mid-year samples cannot resolve the annual cycle
+            self.harmonics = 0
+        y = np.asarray(y, dtype=np.float64)
+        valid = ~np.isnan(y)
+        x = self.design(ds)[valid]
+        self.coef, *_ = np.linalg.lstsq(x, y[valid], rcond=None)
+        residuals = y[valid] - x @ self.coef
+        self.sigma = float(np.sqrt(np.mean(residuals**2)))
+        return self
+
+    def predict(self, ds):
+        yhat = self.design(ds) @ self.coef
+        return pd.DataFrame(
+            {
+                "ds": np.asarray(ds, dtype="datetime64[ns]"),
+                "yhat": yhat,
+                "yhat_lower": yhat - Z_80 * self.sigma,
+                "yhat_upper": yhat + Z_80 * self.sigma,
+            }
+        )
+
+    def to_json(self):
+        return json.dumps(
+            {
+                "harmonics": self.harmonics,
+                "coef": self.coef.tolist(),
+                "sigma": self.sigma,
+            }
+        )
+
+    @classmethod
+    def from_json(cls, text):
+        values = json.loads(text)
+        forecaster = cls(values["harmonics"])
+        forecaster.coef = np.array(values["coef"])
+        forecaster.sigma = values["sigma"]
+        return forecaster
+
+
+FORECASTERS = {"Prophet": ProphetForecaster, "Harmonic": HarmonicForecaster}
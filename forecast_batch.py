@@ -0,0 +1,162 @@
+"""Batch precomputation of the forecasts of all stations.
+
+    python forecast_batch.py [workers ...]
+
+Fits every engine (see forecast.py) at the Year and Month resolutions on
+the complete years of every NBCN station in a process pool; stations that
+are not in the store yet are downloaded first and writes forecasts
+up to HORIZON years ahead to the forecast dataset of the store. A forecast
+is stored with the years it was trained on and the data watermark, so
+NbcnBrowser.predict serves it only while the data is unchanged and fits
+inline otherwise. The job runs once per given worker count and reports the
+fit time per station and the total wall-clock time.
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+import forecast
+import forecast_cache
+import rollups
+import store
+import swiss_nbcn
+
+DATASET = "forecast"
+HORIZON = 100
+RESOLUTIONS = ["Year", "Month"]
+
+
+def read(station, engine, resolution, years, watermark, end_year) -> pd.DataFrame:
+    """Returns the stored forecast up to end_year or None if there is no
+    forecast for these inputs."""
+    df = store.read(DATASET, [station], [datetime.now().year, end_year])
+    if df.empty:
+        return None
+    df = df[
+        (df["engine"] == engine)
+        & (df["resolution"] == resolution)
+        & (df["first_year"] == years[0])
+        & (df["last_year"] == years[1])
+        & (df["watermark"] == watermark)
+    ]
+    if df.empty:
+        return None
+    return df[["ds", "yhat", "yhat_lower", "yhat_upper"]].sort_values(
+        "ds", ignore_index=True
+    )
+
+
+def station_version(station: str):
+    """Returns the first and last year and the watermark of the data of a
+    station as seen by NbcnBrowser (verified and current data)."""
+    fields = ["date", "year"]
+    daily = pd.concat(
+        [store.read(dataset, [station], columns=fields) for dataset in store.DATASETS],
+        ignore_index=True,
+    )
+    years = [int(daily["year"].min()), int(daily["year"].max())]
+    return years, forecast_cache.watermark(daily["date"])
+
+
+def fit_station(station: str, end_year: int):
+    """Fits all engines and resolutions of a station.
+
+    Returns:
+        tuple: forecast rows for the store and fit timings
+    """
+    years, watermark = station_version(station)
+    frames, timings = [], []
+    for resolution in RESOLUTIONS:
+        field = f"{resolution.lower()}_date"
+        df = rollups.read(resolution.lower(), [station])
+        if resolution == "Year":
+            df = df[df["year"] < datetime.now().year]
+        train = df[df["year"] < datetime.now().year]
+        future = forecast.future_dates(df[field].max(), end_year, resolution)
+        for engine, forecaster_class in forecast.FORECASTERS.items():
+            start = time.perf_counter()
+            forecaster = forecaster_class().fit(
+                train[field], train["temp_avg"], resolution
+            )
+            fitted = time.perf_counter()
+            result = forecaster.predict(future)
+            timings.append(
+                {
+                    "station": station,
+                    "engine": engine,
+                    "resolution": resolution,
+                    "fit_s": fitted - start,
+                    "predict_s": time.perf_counter() - fitted,
+                }
+            )
+            frames.append(
+                result.assign(
+                    station=station,
+                    engine=engine,
+                    resolution=resolution,
+                    first_year=years[0],
+                    last_year=years[1],
+                    watermark=watermark,
+                    year=result["ds"].dt.year,
+                )
+            )
+    return pd.concat(frames, ignore_index=True), timings
+
+
+def run(stations: list, max_workers: int) -> pd.DataFrame:
+    """Precomputes and stores the forecasts of the stations, returns the fit
+    timings."""
+    end_year = datetime.now().year + HORIZON
+    timings = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(fit_station, station, end_year) for station in stations
+        ]
+        for future in as_completed(futures):
+            df, station_timings = future.result()
+            store.write(df, DATASET)
+            timings += station_timings
+    return pd.DataFrame(timings)
+
+
+def update_stations() -> list:
+    """Stores all NBCN stations that are not stored yet and refreshes their
+    current data (see NbcnBrowser.update_store), returns the station ids."""
+    browser = swiss_nbcn.NbcnBrowser()
+    browser.update_store(browser.df_stations_full)
+    return sorted(browser.df_stations_full["id"])
+
+
+def stored_stations() -> list:
+    name = rollups.dataset_name(store.VERIFIED, "year")
+    return sorted(store.read(name, columns=["year"])["station"].astype(str).unique())
+
+
+if __name__ == "__main__":
+    stations = update_stations()
+    rows = []
+    for workers in [int(arg) for arg in sys.argv[1:]] or [os.cpu_count()]:
+        start = time.perf_counter()
+        timings = run(stations, workers)
+        rows.append(
+            {
+                "workers": workers,
+                "stations": len(stations),
+                "fit s": timings["fit_s"].sum(),
+                "predict s": timings["predict_s"].sum(),
+                "wall s": time.perf_counter() - start,
+            }
+        )
+    print("Fit time per station [s], last run")
+    print(
+        timings.pivot_table(
+            index="station", columns=["engine", "resolution"], values="fit_s"
+        ).to_string()
+    )
+    print("\nWall-clock time by number of workers")
+    print(pd.DataFrame(rows).to_string(index=False))
@@ -0,0 +1,169 @@
+"""Persistent cache of fitted forecasters and their forecasts.
+
+Entries are keyed by a hash of the inputs that determine them: the station,
+the engine, the resolution, the years the model is trained on and the data
+watermark (the last date and number of rows of the station data), plus the
+end year for forecasts. New data changes the watermark, so stale entries are
+never read and age out. Models are stored as the json of the forecaster
+(see forecast.py), forecasts as parquet; when the total size exceeds
+MAX_BYTES, the least recently used entries are evicted. The app and the
+batch jobs share the cache from different processes, so changes hold a
+lock file (where fcntl is available) and read the index again first.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+import store
+
+try:
+    import fcntl
+except ImportError:  # not available on windows
+    fcntl = None
+
+# folder in the store (see store.path)
+FORECAST_CACHE_DIR = "forecasts"
+MAX_BYTES = 256 * 1024**2
+
+
+def watermark(dates) -> str:
+    """Returns the version of station data: its last date and number of rows."""
+    return f"{pd.Timestamp(dates.max()):%Y-%m-%d}/{len(dates)}"
+
+
+def key(*values) -> str:
+    return hashlib.sha256(json.dumps(values, default=str).encode()).hexdigest()
+
+
+class ForecastCache:
+    def __init__(self, folder=None, max_bytes=MAX_BYTES):
+        """folder defaults to FORECAST_CACHE_DIR in the current store."""
+        self._folder = folder
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.index = self.load_index()
+
+    @property
+    def folder(self) -> str:
+        return self._folder or store.path(FORECAST_CACHE_DIR)
+
+    @property
+    def index_file(self) -> str:
+        return os.path.join(self.folder, "index.json")
+
+    @property
+    def lock_file(self) -> str:
+        return os.path.join(self.folder, "index.lock")
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.folder, self.index[key]["file"])
+
+    def load_index(self) -> dict:
+        if not os.path.exists(self.index_file):
+            return {}
+        with open(self.index_file) as f:
+            return json.load(f)
+
+    def save_index(self):
+        tmp_file = f"{self.index_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_file, self.index_file)
+
+    @contextmanager
+    def locked(self):
+        """Holds the lock of the index across threads and processes and
+        reloads the index, other processes may have changed it."""
+        with self.lock:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(self.lock_file, "w") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                self.index = self.load_index()
+                yield
+
+    def lookup(self, key: str) -> str:
+        """Returns the file of the entry or None if it is not cached."""
+        with self.locked():
+            if key not in self.index:
+                return None
+            if not os.path.exists(self.path(key)):
+                del self.index[key]
+                return None
+            self.index[key]["last_access"] = time.time()
+            self.save_index()
+            return self.path(key)
+
+    def put(self, key: str, suffix: str, write):
+        """Stores an entry written by write(path) and evicts entries above
+        the size limit."""
+        with self.locked():
+            file = f"{key}.{suffix}"
+            path = os.path.join(self.folder, file)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            write(tmp_path)
+            os.replace(tmp_path, path)
+            self.index[key] = {
+                "file": file,
+                "bytes": os.path.getsize(path),
+                "last_access": time.time(),
+            }
+            self.evict()
+            self.save_index()
+
+    def evict(self):
+        total = sum(entry["bytes"] for entry in self.index.values())
+        by_access = sorted(self.index.items(), key=lambda item: item[1]["last_access"])
+        for key, entry in by_access[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass  # evicted by another process
+            del self.index[key]
+            total -= entry["bytes"]
+
+    def load_text(self, key: str) -> str:
+        """Returns the content of a text entry, None if it is not cached or
+        was evicted by another process after the lookup."""
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def load_model(self, key: str, forecaster_class):
+        text = self.load_text(key)
+        return None if text is None else forecaster_class.from_json(text)
+
+    def save_model(self, key: str, forecaster):
+        def write(path):
+            with open(path, "w") as f:
+                f.write(forecaster.to_json())
+
+        self.put(key, "json", write)
+
+    def load_forecast(self, key: str) -> pd.DataFrame:
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            return pd.read_parquet(path)
+        except FileNotFoundError:
+            return None
+
+    def save_forecast(self, key: str, forecast: pd.DataFrame):
+        self.put(key, "parquet", lambda path: forecast.to_parquet(path, index=False))
+
+
+cache = ForecastCache()
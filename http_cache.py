@@ -0,0 +1,132 @@
+"""Persistent cache of the http responses of the MeteoSuisse sources.
+
+Responses are stored on disk keyed by url, the bodies are content addressed
+by their sha256 hash. Each kind of source has its own time to live; when the
+total size exceeds MAX_BYTES, the least recently used entries are evicted.
+In OFFLINE mode the network is never contacted and cached entries are
+served regardless of their age.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_DIR = "./http_cache"
+MAX_BYTES = 512 * 1024**2
+# time to live in seconds
+TTL_STATIONS = 7 * 24 * 3600
+TTL_VERIFIED = 30 * 24 * 3600
+TTL_CURRENT = 3600
+# never contact the network, enabled by NBCN_OFFLINE=1
+OFFLINE = os.environ.get("NBCN_OFFLINE") == "1"
+
+
+class ResponseCache:
+    def __init__(self, folder=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(folder, "index.json")
+        self.lock = threading.Lock()
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+        self.stats = {
+            "hit": 0,
+            "miss": 0,
+            "revalidated": 0,
+            "stale": 0,
+            "bytes_served": 0,
+            "bytes_downloaded": 0,
+        }
+
+    def body_path(self, sha256: str) -> str:
+        return os.path.join(self.folder, f"{sha256}.body")
+
+    def save_index(self):
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_file, self.index_file)
+
+    def lookup(self, url: str) -> dict:
+        """Returns the entry of url or None if it is not cached."""
+        with self.lock:
+            entry = self.index.get(url)
+            missing = entry is not None and not os.path.exists(
+                self.body_path(entry["sha256"])
+            )
+            if missing:
+                del self.index[url]
+                entry = None
+            return None if entry is None else dict(entry)
+
+    def is_fresh(self, entry: dict, ttl: float) -> bool:
+        return OFFLINE or time.time() - entry["fetched_at"] < ttl
+
+    def read(self, entry: dict) -> bytes:
+        """Returns the body of an entry returned by lookup or put, None if it
+        was evicted in the meantime."""
+        with self.lock:
+            try:
+                with open(self.body_path(entry["sha256"]), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+
+    def count(self, url: str, status: str, bytes_served: int):
+        """Records an access to a cached entry as hit, revalidated or stale."""
+        with self.lock:
+            if url in self.index:
+                self.index[url]["last_access"] = time.time()
+            self.stats[status] += 1
+            self.stats["bytes_served"] += bytes_served
+            self.save_index()
+
+    def put(self, url: str, content: bytes, validators: dict) -> dict:
+        """Stores a downloaded body and evicts entries above the size limit."""
+        sha256 = hashlib.sha256(content).hexdigest()
+        with self.lock:
+            os.makedirs(self.folder, exist_ok=True)
+            path = self.body_path(sha256)
+            if not os.path.exists(path):
+                with open(f"{path}.tmp", "wb") as f:
+                    f.write(content)
+                os.replace(f"{path}.tmp", path)
+            now = time.time()
+            self.index[url] = {
+                **validators,
+                "sha256": sha256,
+                "bytes": len(content),
+                "fetched_at": now,
+                "last_access": now,
+            }
+            self.stats["miss"] += 1
+            self.stats["bytes_downloaded"] += len(content)
+            self.evict()
+            self.save_index()
+            return dict(self.index[url])
+
+    def revalidate(self, url: str):
+        """Marks an entry as fresh after the server reported it unchanged."""
+        with self.lock:
+            if url in self.index:
+                self.index[url]["fetched_at"] = time.time()
+                self.save_index()
+
+    def evict(self):
+        # bodies shared by several urls are counted and removed once
+        sizes = {entry["sha256"]: entry["bytes"] for entry in self.index.values()}
+        total = sum(sizes.values())
+        by_access = sorted(self.index.items(), key=lambda item: item[1]["last_access"])
+        for url, entry in by_access[:-1]:
+            if total <= self.max_bytes:
+                break
+            del self.index[url]
+            if all(e["sha256"] != entry["sha256"] for e in self.index.values()):
+                total -= entry["bytes"]
+                os.remove(self.body_path(entry["sha256"]))
+
+
+cache = ResponseCache()
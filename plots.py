@@ -2,9 +2,11 @@ import plotly.graph_objects as go
 import plotly.express as px
 import streamlit as st
 import pandas as pd
-import numpy as np
 import altair as alt
 
+import rolling
+import spiral
+
 
 def line_chart(df, settings):
     title = settings["title"] if "title" in settings else ""
@@ -188,6 +190,8 @@ def time_series_chart(df, settings):
             tooltip=settings["tooltip"],
         )
     )
+    if "color" in settings:
+        plot = plot.encode(color=f"{settings['color']}:N")
     if "y_lower" in settings:
         plot += (
             alt.Chart(df)
@@ -201,13 +205,25 @@ def time_series_chart(df, settings):
 
     if "show_regression" in settings:
         if settings["show_regression"]:
-            line = plot.transform_regression(settings["x"], settings["y"]).mark_line(
-                color="orange"
-            )
+            if "regression" in settings:
+                # end points of the line fitted on the full series
+                line = (
+                    alt.Chart(settings["regression"])
+                    .mark_line(color="orange")
+                    .encode(
+                        x="x",
+                        y="y",
+                    )
+                )
+            else:
+                line = plot.transform_regression(
+                    settings["x"], settings["y"]
+                ).mark_line(color="orange")
             plot += line
     if "show_average" in settings:
         if settings["show_average"]:
-            avg = df[settings["y"]].mean()
+            # the average of the full series if df is downsampled
+            avg = settings.get("average", df[settings["y"]].mean())
             df_avg = pd.DataFrame(
                 {
                     "x": [df[settings["x"]].min(), df[settings["x"]].max()],
@@ -224,16 +240,46 @@ def time_series_chart(df, settings):
             )
             plot += line
     if settings["rolling_avg_window"] > 0:
-        df["ma"] = (
-            df[settings["y"]].rolling(window=settings["rolling_avg_window"]).mean()
+        window = settings["rolling_avg_window"]
+        df_ma = df[[settings["x"]]].join(
+            rolling.compute(df[settings["y"]], [window], ["mean"])
         )
-        # Create the chart
         line = (
-            alt.Chart(df)
+            alt.Chart(df_ma)
             .mark_line(color="green")
-            .encode(x=f"{settings['x']}:T", y=f"ma:Q", strokeWidth=alt.value(3))
+            .encode(
+                x=f"{settings['x']}:T",
+                y=f"mean_{window}:Q",
+                strokeWidth=alt.value(3),
+            )
         )
         plot += line
+    if "rolling_df" in settings:
+        # one line per rolling statistic, the standard deviation on its own axis
+        columns = settings["rolling_columns"]
+        levels = [col for col in columns if not col.startswith("std")]
+        spread = [col for col in columns if col.startswith("std")]
+        if len(levels) > 0:
+            plot += (
+                alt.Chart(settings["rolling_df"])
+                .transform_fold(levels, as_=["statistic", "value"])
+                .mark_line(strokeWidth=2)
+                .encode(
+                    x=f"{settings['x']}:T",
+                    y=alt.Y("value:Q", scale=alt.Scale(domain=settings["y_domain"])),
+                    color=alt.Color("statistic:N", title="rolling"),
+                )
+            )
+        if len(spread) > 0:
+            std = (
+                alt.Chart(settings["rolling_df"])
+                .mark_line(color="gray", strokeDash=[4, 2])
+                .encode(
+                    x=f"{settings['x']}:T",
+                    y=alt.Y(f"{spread[0]}:Q", title=spread[0]),
+                )
+            )
+            plot = alt.layer(plot, std).resolve_scale(y="independent")
 
     if "predict_df" in settings:
         plot += (
@@ -253,6 +299,33 @@ def time_series_chart(df, settings):
     st.altair_chart(plot)
 
 
+def day_of_year_chart(df, settings):
+    """Bands of the day of year climatology (min-max, p10-p90) with the
+    median and mean and the values of one year on top."""
+    title = settings["title"] if "title" in settings else ""
+    x = alt.X(f"{settings['x']}:T", title="", axis=alt.Axis(format="%b"))
+    base = alt.Chart(df)
+    plot = (
+        base.mark_area(opacity=0.2, color="gray").encode(
+            x=x,
+            y=alt.Y("min:Q", title=settings["y_title"]),
+            y2="max:Q",
+        )
+        + base.mark_area(opacity=0.3, color="steelblue").encode(
+            x=x, y="p10:Q", y2="p90:Q"
+        )
+        + base.mark_line(color="steelblue").encode(x=x, y="p50:Q")
+        + base.mark_line(color="black", strokeDash=[4, 2]).encode(x=x, y="mean:Q")
+        + base.mark_line(color="red", clip=True).encode(
+            x=x, y=f"{settings['y']}:Q", tooltip=settings["tooltip"]
+        )
+    )
+    plot = plot.properties(
+        width=settings["width"], height=settings["height"], title=title
+    )
+    st.altair_chart(plot)
+
+
 def heatmap(df, settings):
     title = settings["title"] if "title" in settings else ""
     if not "show_numbers" in settings:
@@ -365,36 +438,11 @@ def histogram(df: pd.DataFrame, settings: dict):
 
 
 def line_chart_3d(df, settings: dict):
-    def value_to_xy(value, month):
-        v = value - settings["min"]
-        # st.write(value, min ,v, month)
-        deg = 360 / 12 * (month - 1)
-        theta_radians = deg * np.pi / 180
-        x = v * np.cos(theta_radians)
-        y = v * np.sin(theta_radians)
-        return x, y
-
-    # df = df[df['month'].isin([1,6,12])]
-    df["x"] = 0
-    df["y"] = 0
-    df["z"] = 0
-
-    for index, row in df.iterrows():
-        x, y = value_to_xy(row[settings["value"]], row["month"])
-        z = row["year"] + (row["month"] - 1) / 12
-
-        df.loc[index, "x"] = x
-        df.loc[index, "y"] = y
-        df.loc[index, "z"] = z
-
-    df["text"] = (
-        df["year"].map(str)
-        + "/"
-        + df["month"].map(str)
-        + ": "
-        + df["value"].round(1).map(str)
-        + " [°C]"
-    )
+    """Spiral of monthly values, one line per station if settings has a
+    "color" column. Coordinates are computed unless df already has them."""
+    if "x" not in df.columns:
+        df = spiral.coordinates(df, settings["value"], settings["min"])
+    hover = settings.get("hover", ["year", "month"])
     # color schemas: https://plotly.com/python/colorscales/#colorscales-in-dash
 
     fig = px.scatter_3d(
@@ -402,12 +450,11 @@ def line_chart_3d(df, settings: dict):
         x="x",
         y="y",
         z="z",
-        color=settings["value"],
+        color=settings.get("color", settings["value"]),
         color_continuous_scale="edge",  # px.colors.sequential.ed
         title=settings["title"],
         hover_data={
-            "year": True,
-            "month": True,
+            **{field: True for field in hover},
             settings["value"]: ":.1f",
             "x": False,
             "y": False,
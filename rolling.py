@@ -0,0 +1,90 @@
+"""Rolling statistics of a series for several window lengths.
+
+Each statistic is computed in O(n) per window independent of its length:
+sums and sums of squares come from cumulative sums (a window sum is the
+difference of two prefix sums), minima and maxima from the van Herk/Gil-Werman
+algorithm, which splits the series into blocks of the window length and
+combines a running extreme from the right end of one block with a running
+extreme from the left end of the next. As in pandas rolling(), the window
+ends at the current row and a window with missing values is NaN.
+"""
+import numpy as np
+import pandas as pd
+
+STATISTICS = ["mean", "min", "max", "std"]
+# window lengths per time resolution, in rows
+WINDOWS = {"Year": [5, 10, 30], "Month": [12, 60, 360], "Day": [30, 365, 3650]}
+
+
+def column_name(statistic: str, window: int) -> str:
+    return f"{statistic}_{window}"
+
+
+def window_sums(cumsum: np.ndarray, window: int) -> np.ndarray:
+    """Returns the sums of the windows ending at each row from the prefix
+    sums of the series (cumsum[0] = 0)."""
+    sums = np.full(len(cumsum) - 1, np.nan)
+    if window < len(cumsum):
+        sums[window - 1 :] = cumsum[window:] - cumsum[:-window]
+    return sums
+
+
+def window_extreme(values: np.ndarray, window: int, accumulate) -> np.ndarray:
+    """Returns the extreme of the windows ending at each row.
+
+    Args:
+        values (np.ndarray): series without NaN
+        window (int): window length
+        accumulate: np.minimum.accumulate or np.maximum.accumulate
+    """
+    n = len(values)
+    result = np.full(n, np.nan)
+    if window > n:
+        return result
+    padded = np.resize(values, -(-n // window) * window).reshape(-1, window)
+    # extreme from the start of the block to each row and from each row to the end
+    prefix = accumulate(padded, axis=1).ravel()[:n]
+    suffix = accumulate(padded[:, ::-1], axis=1)[:, ::-1].ravel()[:n]
+    both = np.stack([suffix[: n - window + 1], prefix[window - 1 :]])
+    result[window - 1 :] = accumulate(both, axis=0)[1]
+    return result
+
+
+def compute(values, windows: list, statistics: list = STATISTICS) -> pd.DataFrame:
+    """Returns the rolling statistics of values for all windows.
+
+    Args:
+        values (pd.Series): series ordered by time, not modified
+        windows (list): window lengths in rows
+        statistics (list): subset of STATISTICS
+
+    Returns:
+        pd.DataFrame: one float32 column <statistic>_<window> per statistic and
+                      window, with the index of values
+    """
+    x = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(x)
+    # centering keeps the sums of squares small for the variance
+    offset = np.nanmean(x) if not missing.all() else 0.0
+    x = np.where(missing, 0.0, x - offset)
+    cumsums = [
+        np.concatenate([[0.0], np.cumsum(series)])
+        for series in [x, x * x, missing.astype(np.float64)]
+    ]
+    result = {}
+    for window in windows:
+        sums, squares, gaps = [window_sums(cumsum, window) for cumsum in cumsums]
+        invalid = gaps != 0
+        mean = sums / window
+        for statistic in statistics:
+            if statistic == "mean":
+                column = mean + offset
+            elif statistic == "std":
+                variance = (squares - window * mean**2) / max(window - 1, 1)
+                column = np.sqrt(np.maximum(variance, 0.0))
+            else:
+                accumulate = getattr(np, f"{statistic}imum").accumulate
+                column = window_extreme(x, window, accumulate) + offset
+            column[invalid] = np.nan
+            result[column_name(statistic, window)] = column.astype(np.float32)
+    return pd.DataFrame(result, index=getattr(values, "index", None))
@@ -0,0 +1,118 @@
+"""Monthly and yearly rollups of the station data, materialized at ingest.
+
+Rollups are stored as partial aggregates (sums, counts, minima, maxima) in
+the store, one dataset per source dataset and resolution, e.g.
+current_month. Partial aggregates can be combined, so rows of new current
+data are aggregated on their own and merged into the stored rollups, and
+the verified and current parts of a month are merged when reading.
+"""
+import pandas as pd
+
+import calendar_dim
+import store
+
+RESOLUTIONS = {"month": ["year", "month"], "year": ["year"]}
+# partial aggregate -> (daily column, aggregation)
+PARTIALS = {
+    "temp_avg_sum": ("temp_avg", "sum"),
+    "temp_avg_count": ("temp_avg", "count"),
+    "temp_min": ("temp_min", "min"),
+    "temp_max": ("temp_max", "max"),
+    "heating_deg_days": ("heating_deg_days", "sum"),
+    "heating_days": ("heating_days", "sum"),
+    "cooling_days": ("cooling_days", "sum"),
+}
+# aggregation combining partial aggregates of the same period
+COMBINE = {
+    "temp_avg_sum": "sum",
+    "temp_avg_count": "sum",
+    "temp_min": "min",
+    "temp_max": "max",
+    "heating_deg_days": "sum",
+    "heating_days": "sum",
+    "cooling_days": "sum",
+}
+
+
+def dataset_name(dataset: str, resolution: str) -> str:
+    return f"{dataset}_{resolution}"
+
+
+def aggregate(daily: pd.DataFrame, resolution: str) -> pd.DataFrame:
+    """Returns the partial aggregates of daily data per station and period."""
+    keys = ["station"] + RESOLUTIONS[resolution]
+    return (
+        daily.groupby(keys, observed=True)
+        .agg(**{name: pd.NamedAgg(*agg) for name, agg in PARTIALS.items()})
+        .reset_index()
+    )
+
+
+def combine(partials: list, resolution: str) -> pd.DataFrame:
+    keys = ["station"] + RESOLUTIONS[resolution]
+    partials = [df for df in partials if not df.empty]
+    if len(partials) == 0:
+        return pd.DataFrame()
+    df = pd.concat(partials, ignore_index=True)
+    df["station"] = df["station"].astype(str)
+    return df.groupby(keys).agg(COMBINE).reset_index()
+
+
+def update(daily: pd.DataFrame, dataset: str, replace: bool = False):
+    """Updates the rollups of dataset with new daily rows.
+
+    Args:
+        daily (pd.DataFrame): new daily rows with derived columns
+        dataset (str): store.VERIFIED or store.CURRENT
+        replace (bool): replace the rollups of the stations in daily instead
+                        of merging the new rows into them
+    """
+    if daily.empty:
+        return
+    for resolution in RESOLUTIONS:
+        name = dataset_name(dataset, resolution)
+        partials = aggregate(daily, resolution)
+        if not replace:
+            stations = list(partials["station"].unique())
+            existing = store.read(name, stations=stations)
+            partials = combine([existing, partials], resolution)
+        store.write(partials, name)
+
+
+def read(resolution: str, stations: list, years: list = None) -> pd.DataFrame:
+    """Returns the monthly or yearly aggregates of the stations.
+
+    Args:
+        resolution (str): month or year
+        stations (list): station ids
+        years (list, optional): [first, last] year, all if None
+
+    Returns:
+        pd.DataFrame: station, year, (month), temp_avg, temp_min, temp_max,
+                      heating_deg_days, heating_days, cooling_days and
+                      month_date or year_date
+    """
+    partials = [
+        store.read(dataset_name(dataset, resolution), stations, years)
+        for dataset in store.DATASETS
+    ]
+    return finish(combine(partials, resolution), resolution)
+
+
+def finish(df: pd.DataFrame, resolution: str) -> pd.DataFrame:
+    """Turns partial aggregates into averages and adds the period date."""
+    if df.empty:
+        return df
+    df.insert(
+        len(RESOLUTIONS[resolution]) + 1,
+        "temp_avg",
+        df["temp_avg_sum"] / df["temp_avg_count"],
+    )
+    df = df.drop(columns=["temp_avg_sum", "temp_avg_count"])
+    if resolution == "month":
+        keys = calendar_dim.month_key(df["year"], df["month"])
+    else:
+        keys = calendar_dim.month_key(df["year"], 7)
+    field = f"{resolution}_date"
+    df[field] = calendar_dim.lookup(keys, [field])[field].to_numpy()
+    return df
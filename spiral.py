@@ -0,0 +1,32 @@
+"""Geometry of the 3D spiral view of monthly values.
+
+Each month is a point at the angle of its month on a circle whose radius is
+the value above min_value; the height is the time (year + month / 12) or a
+ring such as the decade. All coordinates are array expressions over the
+whole frame.
+"""
+import numpy as np
+import pandas as pd
+
+
+def coordinates(df: pd.DataFrame, value: str, min_value: float, z: str = None):
+    """Returns a copy of df with the spiral coordinates x, y and z.
+
+    Args:
+        df (pd.DataFrame): monthly values with month and, if z is None, year
+        value (str): column setting the radius
+        min_value (float): value at the center of the spiral
+        z (str, optional): column used as height, year + (month - 1) / 12 if
+                           None
+
+    Returns:
+        pd.DataFrame: df with the columns x, y and z
+    """
+    month = df["month"].to_numpy(dtype=np.float64)
+    theta = 2 * np.pi * (month - 1) / 12
+    radius = df[value].to_numpy(dtype=np.float64) - min_value
+    if z is None:
+        height = df["year"].to_numpy(dtype=np.float64) + (month - 1) / 12
+    else:
+        height = df[z].to_numpy(dtype=np.float64)
+    return df.assign(x=radius * np.cos(theta), y=radius * np.sin(theta), z=height)
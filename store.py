@@ -0,0 +1,152 @@
+"""Partitioned parquet store for the NBCN daily data.
+
+Each dataset (verified data, current data) is a directory of parquet files
+partitioned by station and decade:
+
+    data/<dataset>/station=<id>/decade=<yyyy>/*.parquet
+
+Reading a single station or a range of years therefore only touches the
+matching files, and only the requested columns are decoded. The layout
+version is kept in data/schema.json; if it does not match SCHEMA_VERSION the
+datasets (the directories partitioned by station) are deleted and rebuilt
+from the source, other files in the folder are kept. A non-empty folder
+without schema.json is not a store and is never touched.
+
+Writing replaces partitions by deleting and rewriting their files, so reads
+and writes of a process are serialized by LOCK; a read never sees a
+partition in the middle of being replaced by another thread.
+"""
+
+import json
+import os
+import shutil
+import threading
+
+import pandas as pd
+
+STORE_DIR = "./data"
+SCHEMA_VERSION = 3
+VERIFIED = "verified"
+CURRENT = "current"
+DATASETS = [VERIFIED, CURRENT]
+LOCK = threading.RLock()
+
+
+def path(name: str) -> str:
+    """Returns the path of a file or folder in the store, resolved on each
+    call so that the store follows a change of STORE_DIR."""
+    return os.path.join(STORE_DIR, name)
+
+
+def dataset_path(dataset: str) -> str:
+    return path(dataset)
+
+
+def is_dataset(path: str) -> bool:
+    """Returns True if path is a dataset directory written by write."""
+    return os.path.isdir(path) and any(
+        name.startswith("station=") for name in os.listdir(path)
+    )
+
+
+def check_schema():
+    """Deletes the datasets if they were written with another schema version.
+
+    Raises:
+        RuntimeError: STORE_DIR is not empty and has no schema.json
+    """
+    with LOCK:
+        schema_file = path("schema.json")
+        if not os.path.exists(schema_file):
+            if os.path.isdir(STORE_DIR) and len(os.listdir(STORE_DIR)) > 0:
+                raise RuntimeError(
+                    f"{STORE_DIR} is not empty and has no schema.json, "
+                    "choose another folder for the store"
+                )
+            version = None
+        else:
+            with open(schema_file) as f:
+                version = json.load(f)["schema_version"]
+        if version != SCHEMA_VERSION:
+            os.makedirs(STORE_DIR, exist_ok=True)
+            for name in os.listdir(STORE_DIR):
+                if is_dataset(path(name)):
+                    shutil.rmtree(path(name))
+            with open(schema_file, "w") as f:
+                json.dump({"schema_version": SCHEMA_VERSION}, f)
+
+
+def exists(dataset: str, station: str = None) -> bool:
+    check_schema()
+    path = dataset_path(dataset)
+    if station is not None:
+        path = os.path.join(path, f"station={station}")
+    return os.path.exists(path)
+
+
+def write(df: pd.DataFrame, dataset: str):
+    """Writes df to the dataset.
+
+    Partitions (station/decade) contained in df are replaced, all other
+    partitions are kept, so a single station can be updated without
+    rewriting the others.
+    """
+    check_schema()
+    df = df.assign(decade=df["year"] // 10 * 10)
+    with LOCK:
+        df.to_parquet(
+            dataset_path(dataset),
+            partition_cols=["station", "decade"],
+            index=False,
+            existing_data_behavior="delete_matching",
+        )
+
+
+def read(dataset: str, stations: list = None, years: list = None, columns=None):
+    """Reads the dataset, optionally restricted to stations, years and columns.
+
+    Args:
+        dataset (str): VERIFIED or CURRENT
+        stations (list, optional): station ids to read, all if None
+        years (list, optional): [first, last] year, all if None
+        columns (list, optional): columns to read, all if None
+
+    Returns:
+        pd.DataFrame: requested rows and columns
+    """
+    check_schema()
+    if not os.path.exists(dataset_path(dataset)):
+        return pd.DataFrame()
+    filters = []
+    if stations is not None:
+        filters.append(("station", "in", list(stations)))
+    if years is not None:
+        filters += [
+            ("decade", ">=", years[0] // 10 * 10),
+            ("decade", "<=", years[1] // 10 * 10),
+            ("year", ">=", years[0]),
+            ("year", "<=", years[1]),
+        ]
+    if columns is not None and "station" not in columns:
+        columns = ["station"] + list(columns)
+    with LOCK:
+        df = pd.read_parquet(
+            dataset_path(dataset), columns=columns, filters=filters or None
+        )
+    df = df.drop(columns=["decade"], errors="ignore")
+    return df[["station"] + [col for col in df.columns if col != "station"]]
+
+
+def migrate_pickle(pickle_file: str, dataset: str, prepare):
+    """One-time import of a data file written by earlier versions.
+
+    Args:
+        pickle_file (str): path of the pickled DataFrame
+        dataset (str): dataset to write to
+        prepare (callable): adds missing columns to the pickled frame
+    """
+    if not os.path.exists(pickle_file) or exists(dataset):
+        return
+    df = pd.read_pickle(pickle_file)
+    write(prepare(df), dataset)
+    os.rename(pickle_file, f"{pickle_file}.migrated")
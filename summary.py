@@ -0,0 +1,74 @@
+"""Summary statistics of all stations of the network in one pass.
+
+Extremes are found per station with grouped idxmin/idxmax reductions, the
+dates are read from the rows they point to instead of scanning the data for
+the extreme values again.
+"""
+import pandas as pd
+
+
+def extremes(df: pd.DataFrame, column: str, prefix: str, fields: list, func: str):
+    """Returns the fields of the row holding the min or max of column per station.
+
+    Args:
+        df (pd.DataFrame): data of several stations
+        column (str): column to find the extreme of
+        prefix (str): prefix of the result columns
+        fields (list): columns of the extreme row to return
+        func (str): idxmin or idxmax
+    """
+    df = df.dropna(subset=[column])
+    index = getattr(df.groupby("station", observed=True)[column], func)()
+    result = df.loc[index.to_numpy(), ["station", column] + fields]
+    result = result.set_index("station")
+    result.index = result.index.astype(str)
+    result.columns = [f"{prefix}_{col}" for col in [column] + fields]
+    return result
+
+
+def network_summary(daily, monthly, yearly) -> pd.DataFrame:
+    """Returns one row of summary statistics per station.
+
+    Args:
+        daily (pd.DataFrame): station, date, temp_min, temp_max per day
+        monthly (pd.DataFrame): monthly aggregates as returned by rollups.read
+        yearly (pd.DataFrame): yearly aggregates of complete years
+
+    Returns:
+        pd.DataFrame: record period, temperature extremes with their dates,
+                      coldest/hottest month and year and yearly averages of
+                      the degree and threshold days
+    """
+    g = daily.groupby("station", observed=True)
+    period = pd.DataFrame(
+        {
+            "first_date": g["date"].min(),
+            "last_date": g["date"].max(),
+            "days": g["date"].count(),
+        }
+    )
+    year_totals = yearly.groupby("station", observed=True).agg(
+        {
+            "temp_avg": "mean",
+            "heating_deg_days": "mean",
+            "heating_days": "mean",
+            "cooling_days": "mean",
+        }
+    )
+    year_totals.columns = [f"{col}_per_year" for col in year_totals.columns]
+    period.index = period.index.astype(str)
+    year_totals.index = year_totals.index.astype(str)
+    result = pd.concat(
+        [
+            period,
+            extremes(daily, "temp_min", "min", ["date"], "idxmin"),
+            extremes(daily, "temp_max", "max", ["date"], "idxmax"),
+            extremes(monthly, "temp_avg", "coldest_month", ["year", "month"], "idxmin"),
+            extremes(monthly, "temp_avg", "hottest_month", ["year", "month"], "idxmax"),
+            extremes(yearly, "temp_avg", "coldest_year", ["year"], "idxmin"),
+            extremes(yearly, "temp_avg", "hottest_year", ["year"], "idxmax"),
+            year_totals,
+        ],
+        axis=1,
+    )
+    return result.rename_axis("station").reset_index()
@@ -1,25 +1,127 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
-from prophet import Prophet
-
-# from sklearn.metrics import mean_absolute_error
+import json
+import time
+import threading
+from io import BytesIO
 
+import calendar_dim
+import climate
+import degree_days
+import downsample
+import events
+import forecast
+import forecast_batch
+import forecast_cache
+import http_cache
 import plots
-from helper import show_table, add_time_columns
-
+import rolling
+import rollups
+import spiral
+import store
+import summary
+from fetch import MAX_WORKERS, fetch_cached, fetch_frames, iter_frames
+from helper import show_table, rss_mb
+from year_index import YearIndex
 
 URL_STATIONS = "https://data.geo.admin.ch/ch.meteoschweiz.klima/nbcn-tageswerte/liste-download-nbcn-d.csv"
+# pickle written by earlier versions, migrated to the store on first start
 BASE_FILE = "./data_previous.pkl"
-START_INDUSTRIAL_PERIOD = 1900
+# per station high-water-mark date and http validators of the current data
+REFRESH_STATE_FILE = "current_state.json"  # in the store, see store.path
+# load the remaining stations in the background after the first page load,
+# enabled by NBCN_PREFETCH_STATIONS=1
+PREFETCH_STATIONS = os.environ.get("NBCN_PREFETCH_STATIONS") == "1"
+# serializes the store updates of the app and the prefetch thread, downloads
+# run outside of it (single reads and writes are atomic, see store.py)
+STORE_LOCK = threading.Lock()
+prefetch_thread = None
+# concurrent downloads of station files, overridden by NBCN_FETCH_WORKERS
+FETCH_WORKERS = int(os.environ.get("NBCN_FETCH_WORKERS", MAX_WORKERS))
+# fetch timings of every ingest and refresh, shown on the Data page
+FETCH_LOG_FILE = "fetch_log.csv"
+FETCH_LOG_FIELDS = [
+    "logged_at",
+    "url_version",
+    "station",
+    "cache",
+    "modified",
+    "bytes",
+    "attempts",
+    "fetch_s",
+    "parse_s",
+    "parse_errors",
+    "rss_mb",
+    "rss_delta_mb",
+]
+FETCH_LOG_LOCK = threading.Lock()
+# NBCN daily format: raw column -> (column name, dtype), other columns are not read
+NBCN_SCHEMA = {
+    "station/location": ("station", "str"),
+    "date": ("date", "int32"),
+    "tre200d0": ("temp_avg", "float32"),
+    "tre200dn": ("temp_min", "float32"),
+    "tre200dx": ("temp_max", "float32"),
+}
+NBCN_MISSING_VALUES = ["-"]
+# in-memory dtypes of the station data, month_date and year_date are not
+# stored per row but looked up for aggregated data (see rollups.read)
+DTYPES = {
+    "station": "category",
+    "temp_avg": "float32",
+    "temp_min": "float32",
+    "temp_max": "float32",
+    "month": "int8",
+    "year": "int16",
+    "day_of_year": "int16",
+    "heating_deg_days": "float32",
+    "heating_days": "int8",
+    "cooling_days": "int8",
+}
+
+
+def parse_nbcn_csv(content: bytes) -> pd.DataFrame:
+    """Parses a NBCN daily data file using NBCN_SCHEMA.
+
+    Only the schema columns are read, with explicit dtypes. If a numeric
+    column holds values other than numbers and missing value markers, the
+    file is parsed again with vectorized coercion, unparsable cells become
+    NaN. The number of such cells is stored in df.attrs["parse_errors"].
+    """
+    dtypes = {raw: dtype for raw, (_, dtype) in NBCN_SCHEMA.items()}
+    names = {raw: name for raw, (name, _) in NBCN_SCHEMA.items()}
+    kwargs = dict(
+        sep=";",
+        encoding="cp1252",
+        usecols=list(NBCN_SCHEMA),
+        na_values=NBCN_MISSING_VALUES,
+    )
+    parse_errors = 0
+    try:
+        df = pd.read_csv(BytesIO(content), dtype=dtypes, **kwargs)
+    except ValueError:
+        df = pd.read_csv(BytesIO(content), dtype=str, **kwargs)
+        for raw, dtype in dtypes.items():
+            if dtype == "str":
+                continue
+            values = pd.to_numeric(df[raw], errors="coerce")
+            parse_errors += int((values.isna() & df[raw].notna()).sum())
+            df[raw] = values.astype(dtype)
+    df = df[list(NBCN_SCHEMA)].rename(columns=names)
+    df.attrs["parse_errors"] = parse_errors
+    return df
 
 
 class NbcnBrowser:
     def __init__(self):
         self.df_stations_full = self.get_stations()
-        self.data = self.get_data(self.df_stations_full)
+        # station data is loaded when a station is selected
+        self.data = pd.DataFrame()
+        if PREFETCH_STATIONS:
+            self.prefetch()
         self._sel_station = ""
         self.station_data = pd.DataFrame()
         self.resolution_options = ["Year", "Month", "Day"]
@@ -32,6 +134,8 @@ class NbcnBrowser:
         ]
         self.parameter_titles = {
             "temp_avg": "Avg Temperature [°C]",
+            "temp_min": "Min Temperature [°C]",
+            "temp_max": "Max Temperature [°C]",
             "heating_deg_days": "Heating degree days",
             "cooling_days": "Cooling days",
             "heating_days": "Heating days",
@@ -45,7 +149,9 @@ class NbcnBrowser:
     @sel_station.setter
     def sel_station(self, id):
         self._sel_station = id
-        self.data = self.data[self.data["station"] == id]
+        stations = self.df_stations_full
+        self.data = self.get_data(stations[stations["id"] == id])
+        self.year_index = YearIndex(self.data["year"])
         self.year_min, self.year_max = self.data["year"].min(), self.data["year"].max()
 
     @property
@@ -62,20 +168,222 @@ class NbcnBrowser:
 
     @st.experimental_memo
     def get_data(_self, df_stations: pd.DataFrame):
-        if os.path.exists(BASE_FILE):
-            previous_data = pd.read_pickle(BASE_FILE)
-        else:
-            previous_data = _self.get_temperature_data(df_stations, "url_verified_data")
-            _self.save_base(previous_data)
-        current_data = _self.get_temperature_data(df_stations, "url_current_data")
+        return _self.load_data(df_stations)
+
+    @st.experimental_memo
+    def get_rollups(_self, station: str, resolution: str):
+        """Returns the monthly (resolution="month") or yearly aggregates of a
+        station, materialized at ingest."""
+        return rollups.read(resolution, [station])
+
+    def load_data(self, df_stations: pd.DataFrame):
+        """Returns verified and current data of the given stations.
+
+        Verified data of stations not yet in the store is downloaded and
+        stored, all other stations are read from the store.
+        """
+        current_data = self.update_store(df_stations)
+        stations = list(df_stations["id"])
+        previous_data = store.read(store.VERIFIED, stations=stations)
         result = pd.concat([previous_data, current_data], axis=0, ignore_index=True)
-        result = _self.add_time_columns(result)
-        result = _self.add_heat_cold_days_columns(result)
+        result = result.astype(DTYPES)
+        result = result.sort_values(["station", "date"], ignore_index=True)
         return result
 
+    def update_store(self, df_stations: pd.DataFrame):
+        """Ingests missing verified data and refreshes the current data of
+        the given stations, returns the current data."""
+        with STORE_LOCK:
+            store.migrate_pickle(BASE_FILE, store.VERIFIED, self.prepare_base)
+        stations = list(df_stations["id"])
+        missing = [id for id in stations if not store.exists(store.VERIFIED, id)]
+        if len(missing) > 0:
+            self.ingest_verified_data(df_stations[df_stations["id"].isin(missing)])
+        return self.refresh_current_data(df_stations)
+
+    @st.experimental_memo
+    def get_network_summary(_self):
+        """Returns the summary statistics of all stations (see summary.py)."""
+        stations = list(_self.df_stations_full["id"])
+        daily = _self.network_daily(stations, ["date", "temp_min", "temp_max"])
+        monthly = rollups.read("month", stations)
+        yearly = rollups.read("year", stations)
+        yearly = yearly[yearly["year"] < datetime.now().year]
+        return summary.network_summary(daily, monthly, yearly)
+
+    @st.experimental_memo
+    def get_events(_self):
+        """Returns the yearly heatwave, frost spell and tropical night
+        statistics of all stations (see events.py)."""
+        stations = list(_self.df_stations_full["id"])
+        daily = _self.network_daily(stations, ["date", "temp_min", "temp_max"])
+        daily["station"] = daily["station"].astype("category")
+        daily = daily.sort_values(["station", "date"], ignore_index=True)
+        return events.detect(daily)
+
+    def network_daily(self, stations: list, fields: list) -> pd.DataFrame:
+        """Returns the fields of the verified and current daily data of the
+        stations, after updating them in the store."""
+        current_data = self.update_store(self.stations_df(stations))
+        return pd.concat(
+            [
+                store.read(store.VERIFIED, stations=stations, columns=fields),
+                current_data[["station"] + fields],
+            ],
+            ignore_index=True,
+        )
+
+    def stations_df(self, stations) -> pd.DataFrame:
+        """Returns the rows of df_stations_full of the given station ids."""
+        df_stations = self.df_stations_full
+        return df_stations[df_stations["id"].isin(stations)]
+
+    def ingest_verified_data(self, df_stations: pd.DataFrame):
+        """Downloads, derives and stores the verified data station by station.
+
+        No frame with more than one station is built: each station is
+        derived and written before the next one is taken, while up to
+        FETCH_WORKERS further files are downloaded and parsed. The memory of
+        a full rebuild therefore grows with FETCH_WORKERS, not with the
+        number of stations; the resident memory and its change per station
+        are logged in FETCH_LOG_FILE. The monthly and yearly rollups of the
+        station are built in the same pass.
+        """
+        for _, df in self.get_temperature_data(df_stations, "url_verified_data"):
+            df = self.add_derived_columns(df)
+            with STORE_LOCK:
+                store.write(df, store.VERIFIED)
+                rollups.update(df, store.VERIFIED, replace=True)
+
+    def prefetch(self):
+        """Stores all stations in a background thread, once per process."""
+        global prefetch_thread
+        if prefetch_thread is None:
+            prefetch_thread = threading.Thread(
+                target=self.prefetch_stations, daemon=True
+            )
+            prefetch_thread.start()
+
+    def prefetch_stations(self):
+        """Updates the store one station at a time. STORE_LOCK is only taken
+        for the writes of a station, so a station selected in the app is
+        downloaded and stored in between."""
+        for i in range(len(self.df_stations_full)):
+            self.update_store(self.df_stations_full.iloc[[i]])
+
+    def refresh_current_data(self, df_stations: pd.DataFrame, full: bool = False):
+        """Returns the current data of all stations, downloading only what changed.
+
+        For each station the date of the newest row (high-water mark) and the
+        validators (ETag/Last-Modified, content hash) of the last download are
+        kept in REFRESH_STATE_FILE. Expired files are revalidated with
+        conditional requests and only parsed if their content changed. Only
+        rows newer than the watermark get derived columns and are appended to
+        the current dataset of the store, so the cost scales with the number
+        of new days.
+
+        Args:
+            df_stations (pd.DataFrame): stations as returned by get_stations
+            full (bool): ignore the stored state and download everything again
+
+        Returns:
+            pd.DataFrame: current data with derived columns
+        """
+        urls = dict(zip(df_stations["id"], df_stations["url_current_data"]))
+        with STORE_LOCK:
+            state = self.load_refresh_state(list(urls), full)
+        validators = {
+            station: {k: v for k, v in state[station].items() if k != "watermark"}
+            for station in urls
+            if station in state
+        }
+        frames, timings = fetch_frames(
+            urls,
+            parse=parse_nbcn_csv,
+            max_workers=FETCH_WORKERS,
+            validators=validators,
+            ttl=http_cache.TTL_CURRENT,
+        )
+        timings["url_version"] = "url_current_data"
+        timings["parse_errors"] = [
+            0 if df is None else df.attrs["parse_errors"] for df in frames.values()
+        ]
+        self.log_fetch_timings(timings)
+
+        with STORE_LOCK:
+            # read again, another thread may have stored the same stations
+            # during the download
+            state = self.load_refresh_state(list(urls), full)
+            # stations without watermark are downloaded completely
+            known = [s for s in urls if "watermark" in state.get(s, {})]
+            current_data = store.read(store.CURRENT, stations=list(urls))
+            if not current_data.empty:
+                current_data = current_data[current_data["station"].isin(known)]
+
+            new_rows = []
+            for station, timing in timings.set_index("station").iterrows():
+                station_state = state.get(station, {})
+                df = frames[station]
+                if df is not None:
+                    if "watermark" in station_state:
+                        df = df[df["date"] > station_state["watermark"]]
+                    if len(df) > 0:
+                        new_rows.append(df)
+                        station_state["watermark"] = int(df["date"].max())
+                for key in ["etag", "last_modified", "sha256"]:
+                    station_state.pop(key, None)
+                    if pd.notna(timing[key]):
+                        station_state[key] = timing[key]
+                state[station] = station_state
+
+            if len(new_rows) > 0:
+                new_data = self.add_derived_columns(pd.concat(new_rows))
+                current_data = pd.concat([current_data, new_data], ignore_index=True)
+                updated = current_data["station"].isin(new_data["station"].unique())
+                store.write(current_data[updated], store.CURRENT)
+                is_known = new_data["station"].isin(known)
+                rollups.update(new_data[is_known], store.CURRENT)
+                rollups.update(new_data[~is_known], store.CURRENT, replace=True)
+            state_file = store.path(REFRESH_STATE_FILE)
+            with open(f"{state_file}.tmp", "w") as f:
+                json.dump(state, f)
+            os.replace(f"{state_file}.tmp", state_file)
+        return current_data
+
+    def load_refresh_state(self, stations: list, full: bool) -> dict:
+        """Returns the refresh state of all stations, without the entries of
+        the given stations if full or if there is no current data yet."""
+        state = {}
+        state_file = store.path(REFRESH_STATE_FILE)
+        if os.path.exists(state_file):
+            with open(state_file) as f:
+                state = json.load(f)
+        if full or not store.exists(store.CURRENT):
+            for station in stations:
+                state.pop(station, None)
+        return state
+
+    def prepare_base(self, df):
+        # pickles of earlier versions hold the raw columns only
+        if "year" not in df.columns:
+            df = self.add_derived_columns(df)
+        rollups.update(df, store.VERIFIED, replace=True)
+        return df
+
+    def add_derived_columns(self, df):
+        df = self.add_time_columns(df)
+        df = self.add_heat_cold_days_columns(df)
+        return df.astype(DTYPES)
+
+    @property
+    def memory_footprint(self) -> int:
+        """Memory used by the data of the selected station in bytes."""
+        return int(self.data.memory_usage(deep=True).sum())
+
     @st.experimental_memo
     def get_stations(_self):
-        _df = pd.read_csv(URL_STATIONS, sep=";", encoding="cp1252")
+        content, *_ = fetch_cached(URL_STATIONS, http_cache.TTL_STATIONS)
+        _df = pd.read_csv(BytesIO(content), sep=";", encoding="cp1252")
         _df.columns = [
             "station",
             "id",
@@ -94,85 +402,20 @@ class NbcnBrowser:
         _df = _df[_df["station"].notna()]
         return _df
 
-    def rename_columns(self, df):
-        def f(x):
-            try:
-                return np.float32(x)
-            except:
-                return np.nan
-
-        df.columns = [
-            "station",
-            "date",
-            "radiation",
-            "snowpack",
-            "nto000d0",
-            "prestad0",
-            "precip",
-            "sunshine_dur",
-            "temp_avg",
-            "temp_min",
-            "temp_max",
-            "ure200d0",
-        ]
-        fields = [
-            "station",
-            "date",
-            "temp_avg",
-            "temp_min",
-            "temp_max",
-        ]
-        num_columns = [
-            "temp_avg",
-            "temp_min",
-            "temp_max",
-        ]
-        for col in num_columns:
-            df[col] = df[col].apply(f)
-        return df[fields]
-
     def add_heat_cold_days_columns(self, df):
-        # https://www.meteoschweiz.admin.ch/wetter/wetter-und-klima-von-a-bis-z/kuehltag.html
-        # https://www.meteoschweiz.admin.ch/wetter/wetter-und-klima-von-a-bis-z.html
-
-        outside_temp = 12  # Heating degree days
-        room_temp = 20
-        threshold_high = 18.3  # Cooling degree days
-        # todo: find out official definition
-        # df["cooling_deg_days"] = df.apply(
-        #    lambda x: x["temp_avg"] - threshold_high
-        #    if x["temp_avg"] > threshold_high
-        #    else 0,
-        #    axis=1,
-        # )
-        df["heating_deg_days"] = df.apply(
-            lambda x: room_temp - x["temp_avg"] if x["temp_avg"] < outside_temp else 0,
-            axis=1,
-        )
-        df["heating_days"] = df.apply(
-            lambda x: 1 if x["temp_avg"] < outside_temp else 0, axis=1
-        )
-        df["cooling_days"] = df.apply(
-            lambda x: 1 if x["temp_avg"] > threshold_high else 0, axis=1
-        )
+        values = degree_days.compute(df["temp_avg"].to_numpy())
+        for name, column in values.items():
+            df[name] = column
         return df
 
     def add_time_columns(self, df):
-        df["date"] = pd.to_datetime(df["date"], format="%Y%m%d")
-        df["month"] = df["date"].dt.month
-        df["year"] = df["date"].dt.year
-        df["day_of_year"] = df["date"].dt.dayofyear
-        df["day"] = 15
-        df["month_date"] = pd.to_datetime(df[["year", "month", "day"]])
-        df["jul"] = 7
-        df["year_date"] = pd.to_datetime(dict(year=df.year, month=df.jul, day=df.day))
-        df = df.drop(["day", "jul"], axis=1)
-
+        keys = calendar_dim.parse_yyyymmdd(df["date"])
+        fields = ["date", "month", "year", "day_of_year"]
+        calendar = calendar_dim.lookup(keys, fields)
+        for field in fields:
+            df[field] = calendar[field].to_numpy()
         return df
 
-    def save_base(self, df):
-        df.to_pickle("./data_previous.pkl")
-
     def get_temperature_data(self, station_df: pd.DataFrame, url_version):
         """Format:
         station/location     Stationskürzel <nat_abbr>
@@ -191,36 +434,87 @@ class NbcnBrowser:
             ure200d0             %                Relative Luftfeuchtigkeit 2 m über Boden; Tagesmittel
 
 
+        The station files are downloaded concurrently and yielded one station
+        at a time. Fetch and parse timings, the number of unparsable cells and
+        the resident memory of the process after each station, with its change
+        while the station was processed, are appended to FETCH_LOG_FILE.
+
         Args:
-            df (pd.DataFrame): _description_
+            station_df (pd.DataFrame): stations as returned by get_stations
+            url_version (str): url_verified_data or url_current_data
 
-        Returns:
-            _type_: _description_
+        Yields:
+            tuple: station id, temperature data of the station (pd.DataFrame)
         """
-        lst = []
-        for index, row in station_df.iterrows():
-            _df = pd.read_csv(row[url_version], sep=";", encoding="cp1252")
-            lst.append(_df)
-        result = pd.concat(lst)
-        result = self.rename_columns(result)
+        urls = dict(zip(station_df["id"], station_df[url_version]))
         if url_version == "url_verified_data":
-            self.save_base(result)
-        return result
+            ttl = http_cache.TTL_VERIFIED
+        else:
+            ttl = http_cache.TTL_CURRENT
+        timings = []
+        frames = iter_frames(
+            urls, parse=parse_nbcn_csv, max_workers=FETCH_WORKERS, ttl=ttl
+        )
+        for station, df, timing in frames:
+            timing["url_version"] = url_version
+            timing["parse_errors"] = df.attrs["parse_errors"]
+            before = rss_mb()
+            yield station, df
+            # measured after the consumer has processed the station
+            timing["rss_mb"] = rss_mb()
+            if before is not None:
+                timing["rss_delta_mb"] = timing["rss_mb"] - before
+            timings.append(timing)
+        self.log_fetch_timings(pd.DataFrame(timings))
 
-    def get_summary_table(self, df):
-        date_min_val = df["temp_min"].min()
-        date_max_val = df["temp_max"].max()
-        date_min = df.loc[df["temp_min"] == date_min_val, "date"]
-        date_min = date_min.iloc[0].strftime("%Y-%m-%d")
-        date_max = df.loc[df["temp_max"] == date_max_val, "date"]
-        date_max = date_max.iloc[0].strftime("%Y-%m-%d")
+    def log_fetch_timings(self, timings: pd.DataFrame):
+        """Appends the timings of a download to FETCH_LOG_FILE."""
+        if timings.empty:
+            return
+        timings = timings.assign(logged_at=datetime.now().isoformat(timespec="seconds"))
+        with FETCH_LOG_LOCK:
+            os.makedirs(store.STORE_DIR, exist_ok=True)
+            timings.reindex(columns=FETCH_LOG_FIELDS).to_csv(
+                store.path(FETCH_LOG_FILE),
+                mode="a",
+                header=not os.path.exists(store.path(FETCH_LOG_FILE)),
+                index=False,
+            )
+
+    def show_fetch_log(self):
+        """Shows the latest downloads and the response cache statistics of
+        this process."""
+        st.caption(f"{FETCH_WORKERS} concurrent downloads")
+        if os.path.exists(store.path(FETCH_LOG_FILE)):
+            log = pd.read_csv(store.path(FETCH_LOG_FILE))
+            runs = (
+                log.groupby(["logged_at", "url_version"])
+                .agg(
+                    files=("station", "size"),
+                    modified=("modified", "sum"),
+                    MB=("bytes", lambda values: values.sum() / 1024**2),
+                    fetch_s=("fetch_s", "sum"),
+                    parse_s=("parse_s", "sum"),
+                    parse_errors=("parse_errors", "sum"),
+                    rss_mb=("rss_mb", "max"),
+                    rss_delta_mb=("rss_delta_mb", "sum"),
+                )
+                .reset_index()
+            )
+            st.write(runs.tail(20).iloc[::-1])
+            st.write(log[log["station"] == self.sel_station].tail(20).iloc[::-1])
+        st.write(pd.DataFrame([http_cache.cache.stats]))
+
+    def get_summary_table(self):
+        day_min = self.data["temp_min"].idxmin()
+        day_max = self.data["temp_max"].idxmax()
+        date_min_val = self.data.at[day_min, "temp_min"]
+        date_max_val = self.data.at[day_max, "temp_max"]
+        date_min = self.data.at[day_min, "date"].strftime("%Y-%m-%d")
+        date_max = self.data.at[day_max, "date"].strftime("%Y-%m-%d")
 
         month_fields = ["year", "month", "temp_avg", "heating_deg_days"]
-        month_stat = (
-            df[month_fields]
-            .groupby(["year", "month"])
-            .agg({"temp_avg": "mean", "heating_deg_days": "sum"})
-        ).reset_index()
+        month_stat = self.get_rollups(self.sel_station, "month")[month_fields]
         min_month_val = month_stat["temp_avg"].min()
         max_month_val = month_stat["temp_avg"].max()
         month_min = month_stat.loc[month_stat["temp_avg"] == min_month_val]
@@ -233,13 +527,8 @@ class NbcnBrowser:
         )
 
         year_fields = ["year", "temp_avg", "heating_deg_days"]
-        year_stat = (
-            df.loc[df["year"] < datetime.now().year, year_fields]
-            .groupby(["year"])
-            .agg({"temp_avg": "mean", "heating_deg_days": "sum"})
-            .reset_index()
-        )
-        year_stat.columns = year_fields
+        year_stat = self.get_rollups(self.sel_station, "year")
+        year_stat = year_stat.loc[year_stat["year"] < datetime.now().year, year_fields]
 
         min_year_val = year_stat["temp_avg"].min()
         max_year_val = year_stat["temp_avg"].max()
@@ -282,32 +571,42 @@ class NbcnBrowser:
 
     def show_summary(self, row):
         st.markdown(self.station_link(row))
-        summary, month_stat, year_stat = self.get_summary_table(self.data)
+        summary, month_stat, year_stat = self.get_summary_table()
         st.markdown(f"Summary {year_stat['year'].min()} - {year_stat['year'].max()}")
         st.write(summary)
         st.markdown("Yearly temperature average and heating degree days")
         st.write(year_stat)
         st.markdown("Monthly temperature average and heating degree days")
         st.write(month_stat)
+        if st.checkbox("Compare with all stations"):
+            st.markdown("Summary of all NBCN stations")
+            st.write(self.get_network_summary())
+        if st.checkbox("Show heatwaves and cold spells"):
+            event = st.selectbox(
+                "Event",
+                options=list(events.EVENTS),
+                format_func=lambda x: x.replace("_", " ").capitalize(),
+            )
+            yearly = self.get_events()[event]
+            st.markdown("Events per year")
+            st.write(yearly[yearly["station"] == self.sel_station])
+            st.markdown("Events of all NBCN stations")
+            g = yearly.groupby("station")
+            st.write(
+                pd.DataFrame(
+                    {
+                        "events": g["events"].sum(),
+                        "event_days": g["event_days"].sum(),
+                        "longest_days": g["longest_days"].max(),
+                    }
+                )
+            )
 
-    def add_diff_column(self, data, climate_normal):
-        data = data.join(
-            climate_normal.set_index("month"),
-            on="month",
-            how="inner",
-            lsuffix="",
-            rsuffix="_agg",
-        )
-        data["value_diff"] = (data["value"] - data["mean"]).astype(float)
-        return data
-
-    def get_climate_normal(self, data: pd.DataFrame):
-        df = data[data["year"] < START_INDUSTRIAL_PERIOD]
-        fields = ["month", "value"]
-        group_fields = ["month"]
-        df = df[fields].groupby(group_fields)["value"].agg(["mean"]).reset_index()
-        df = df.rename(columns={"value": "mean"})
-        return df
+    @st.experimental_memo
+    def get_climate_normals(_self, station: str, period: tuple):
+        """Returns the monthly climate normals of a station for a reference
+        period, cached per station and period."""
+        return climate.normals(_self.get_rollups(station, "month"), period)
 
     def get_user_options(self, type: str):
         with st.sidebar.expander("⚙️ Settings", expanded=True):
@@ -328,6 +627,20 @@ class NbcnBrowser:
             if type == "time-series":
                 self.show_regression = st.checkbox("Show Regression")
                 self.show_average = st.checkbox("Show Average")
+                self.downsampling = st.selectbox(
+                    "Downsampling", options=downsample.METHODS
+                )
+                self.rolling_window = st.selectbox(
+                    "Rolling Window",
+                    options=[0] + rolling.WINDOWS[self.resolution],
+                    format_func=lambda x: "None" if x == 0 else f"{x} rows",
+                )
+                if self.rolling_window > 0:
+                    self.rolling_stats = st.multiselect(
+                        "Rolling Statistics",
+                        options=rolling.STATISTICS,
+                        default=["mean"],
+                    )
                 ok = (self.parameter == "temp_avg") & (
                     self.resolution_options.index(self.resolution) < 2
                 )
@@ -340,73 +653,67 @@ class NbcnBrowser:
                             max_value=datetime.now().year + 100,
                             value=datetime.now().year + 10,
                         )
+                        self.forecast_engine = st.selectbox(
+                            "Forecast Engine", options=list(forecast.FORECASTERS)
+                        )
                 else:
                     self.show_prediction = False
 
-    def filter_data(self):
-        if self.resolution_options.index(self.resolution) == 2:
+    def resolution_data(self, resolution: str):
+        """Returns all data of the selected station at the given resolution
+        and the year index of its rows."""
+        if self.resolution_options.index(resolution) == 2:
             df = self.data
+            year_index = self.year_index
             self.x_var = "date"
-        elif self.resolution_options.index(self.resolution) == 1:
+        elif self.resolution_options.index(resolution) == 1:
             all_fields = [
                 "year",
                 "month",
-                "month_date",
                 "temp_avg",
                 "heating_deg_days",
                 "cooling_days",
                 "heating_days",
+                "month_date",
             ]
-            df = (
-                self.data[all_fields]
-                .groupby(["year", "month", "month_date"])
-                .agg(
-                    {
-                        "temp_avg": ["mean"],
-                        "heating_deg_days": ["sum"],
-                        "cooling_days": ["sum"],
-                        "heating_days": ["sum"],
-                    }
-                )
-                .reset_index()
-            )
-            # after aggregation, column names are composed field-agg
-            df.columns = all_fields
+            df = self.get_rollups(self.sel_station, "month")[all_fields]
+            year_index = YearIndex(df["year"])
             self.x_var = "month_date"
-        elif self.resolution_options.index(self.resolution) == 0:
+        elif self.resolution_options.index(resolution) == 0:
             all_fields = [
                 "year",
-                "year_date",
                 "temp_avg",
                 "heating_deg_days",
                 "cooling_days",
                 "heating_days",
+                "year_date",
             ]
-            df = (
-                self.data[all_fields]
-                .groupby(["year", "year_date"])
-                .agg(
-                    {
-                        "temp_avg": ["mean"],
-                        "heating_deg_days": ["sum"],
-                        "cooling_days": ["sum"],
-                        "heating_days": ["sum"],
-                    }
-                )
-                .reset_index()
-            )
-            df.columns = all_fields
+            df = self.get_rollups(self.sel_station, "year")[all_fields]
             df = df[df["year"] < datetime.now().year]
+            year_index = YearIndex(df["year"])
             self.x_var = "year_date"
+        return df, year_index
+
+    def filter_data(self):
+        df, year_index = self.resolution_data(self.resolution)
         if self.years != [self.year_min, self.year_max]:
-            df = df[(df["year"] >= self.years[0]) & (df["year"] <= self.years[1])]
+            df = year_index.select(df, self.years)
         return df
 
+    @st.experimental_memo
+    def get_rolling_stats(_self, station: str, parameter: str, resolution: str):
+        """Returns the rolling statistics of a parameter of the station for
+        all window lengths of the resolution, computed over the full series
+        and indexed like the data of the resolution."""
+        df, _ = _self.resolution_data(resolution)
+        return rolling.compute(df[parameter], rolling.WINDOWS[resolution])
+
     def show_data(self, row):
         st.markdown(self.station_link(row))
         self.resolution = self.resolution_options[2]
         data_df = self.filter_data()
         st.write(data_df)
+        st.caption(f"In-memory size: {self.memory_footprint / 1024**2 :.1f} MB")
         csv = data_df.to_csv(index=False).encode("utf-8")
         text = "The table above includes additional columns as compared to the original MeteoSuisse data. The original data can be downloaded [here](https://opendata.swiss/de/dataset/klimamessnetz-tageswerte)."
         st.markdown(text, unsafe_allow_html=True)
@@ -416,6 +723,8 @@ class NbcnBrowser:
             file_name=f'{row.iloc[0]["station"]}.csv',
             mime="text/csv",
         )
+        with st.expander("Downloads", expanded=False):
+            self.show_fetch_log()
 
     def show_time_series(self, row):
         st.markdown(self.station_link(row))
@@ -423,7 +732,6 @@ class NbcnBrowser:
         settings = {
             "x": self.x_var,
             "y": self.parameter,
-            "color": "station",
             "x_title": "",
             "y_title": self.parameter_titles[self.parameter],
             "tooltip": [self.x_var, self.parameter],
@@ -437,54 +745,267 @@ class NbcnBrowser:
             plot_df[self.parameter].min() - 1,
             plot_df[self.parameter].max() + 1,
         ]
+        if self.rolling_window > 0 and len(self.rolling_stats) > 0:
+            stats = self.get_rolling_stats(
+                self.sel_station, self.parameter, self.resolution
+            )
+            columns = [
+                rolling.column_name(stat, self.rolling_window)
+                for stat in self.rolling_stats
+            ]
+            settings["rolling_df"] = plot_df[[self.x_var]].join(stats[columns])
+            settings["rolling_columns"] = columns
         if self.show_prediction:
             settings["predict_df"] = self.predict()
             settings["predict_x"] = self.x_var
             settings["predict_y"] = "yhat"
 
-        plots.time_series_chart(plot_df, settings)
-        if self.show_prediction:
-            self.predict()
+        # about one point per pixel, only the plotted columns are sent
+        rows = downsample.rows(
+            plot_df, self.x_var, self.parameter, settings["width"], self.downsampling
+        )
+        settings["average"] = plot_df[self.parameter].mean()
+        if self.show_regression and plot_df[self.parameter].count() > 1:
+            settings["regression"] = self.regression_line(plot_df)
+        if "rolling_df" in settings:
+            settings["rolling_df"] = settings["rolling_df"].iloc[rows]
+        chart_df = plot_df.iloc[rows][[self.x_var, self.parameter]]
+        plots.time_series_chart(chart_df, settings)
+        st.caption(
+            f"Chart data: {len(plot_df):,} → {len(chart_df):,} rows, "
+            f"{downsample.payload_bytes(plot_df, rows) / 1024 :,.0f} → "
+            f"{downsample.payload_bytes(chart_df) / 1024 :,.0f} kB"
+        )
 
-    def show_spiral(self, row):
-        def aggregate_data(df, datasource_id: int):
-            df = (
-                df[["year", "month", self.parameter]]
-                .groupby(["year", "month"])
-                .agg("mean")
-                .reset_index()
+    def regression_line(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Returns the end points (x, y) of the least squares line of the
+        parameter over time, fitted on all rows of df."""
+        df = df[[self.x_var, self.parameter]].dropna()
+        seconds = df[self.x_var].to_numpy(dtype="datetime64[s]").astype(np.float64)
+        ends = np.array([seconds.min(), seconds.max()])
+        # relative to the first date, the fit is badly conditioned otherwise
+        slope, intercept = np.polyfit(
+            seconds - ends[0], df[self.parameter].to_numpy(dtype=np.float64), 1
+        )
+        return pd.DataFrame(
+            {
+                "x": pd.to_datetime(ends, unit="s"),
+                "y": intercept + slope * (ends - ends[0]),
+            }
+        )
+
+    @st.experimental_memo
+    def get_comparison_data(_self, stations: tuple, resolution: str):
+        """Returns the data of several stations at the given resolution.
+
+        Month and Year are read from the rollups of all stations at once,
+        Day from the store, reading only the parameter columns.
+        """
+        if resolution == "Day":
+            fields = ["date", "year"] + _self.parameter_options
+            df = _self.network_daily(list(stations), fields)
+            df = df.sort_values(["station", "date"], ignore_index=True)
+        else:
+            _self.update_store(_self.stations_df(stations))
+            df = rollups.read(resolution.lower(), list(stations))
+            if resolution == "Year":
+                df = df[df["year"] < datetime.now().year]
+        df["station"] = df["station"].astype(str)
+        return df
+
+    def show_comparison(self):
+        stations = self.df_stations_full
+        names = dict(zip(stations["id"], stations["station"]))
+        with st.sidebar.expander("⚙️ Settings", expanded=True):
+            sel_stations = st.multiselect(
+                "Stations",
+                options=list(stations["id"]),
+                default=list(stations["id"])[:5],
+                format_func=lambda id: names[id],
+            )
+            self.parameter = st.selectbox("Parameter", options=self.parameter_options)
+            self.resolution = st.selectbox(
+                "Time Resolution", self.resolution_options, key="compare_resolution"
+            )
+            self.downsampling = st.selectbox(
+                "Downsampling", options=downsample.METHODS, key="compare_downsampling"
+            )
+        if len(sel_stations) == 0:
+            st.info("Select one or more stations")
+            return
+        start = time.perf_counter()
+        plot_df = self.get_comparison_data(tuple(sel_stations), self.resolution)
+        x_var = {"Year": "year_date", "Month": "month_date", "Day": "date"}
+        x_var = x_var[self.resolution]
+        settings = {
+            "x": x_var,
+            "y": self.parameter,
+            "color": "station",
+            "x_title": "",
+            "y_title": self.parameter_titles[self.parameter],
+            "tooltip": ["station", x_var, self.parameter],
+            "width": 1000,
+            "height": 400,
+            "title": "",
+            "y_domain": [
+                plot_df[self.parameter].min() - 1,
+                plot_df[self.parameter].max() + 1,
+            ],
+        }
+        # about one point per pixel and station, only the plotted columns are sent
+        rows = np.concatenate(
+            [
+                positions[
+                    downsample.rows(
+                        plot_df.iloc[positions],
+                        x_var,
+                        self.parameter,
+                        settings["width"],
+                        self.downsampling,
+                    )
+                ]
+                for positions in plot_df.groupby("station").indices.values()
+            ]
+        )
+        chart_df = plot_df.iloc[rows][["station", x_var, self.parameter]]
+        plots.time_series_chart(chart_df, settings)
+        st.caption(
+            f"{len(sel_stations)} stations, chart data: {len(plot_df):,} → "
+            f"{len(chart_df):,} rows, "
+            f"{downsample.payload_bytes(plot_df, rows) / 1024 :,.0f} → "
+            f"{downsample.payload_bytes(chart_df) / 1024 :,.0f} kB, "
+            f"{time.perf_counter() - start :.2f} s"
+        )
+
+    @st.experimental_memo
+    def get_climatology(_self, station: str, parameter: str, smoothing: int):
+        """Returns the day of year climatology of a parameter over the
+        complete years of the station, cached per station."""
+        df = _self.year_index.select(
+            _self.data, [_self.year_min, datetime.now().year - 1]
+        )
+        return climate.climatology(df, parameter, smoothing)
+
+    def show_day_of_year(self, row):
+        st.markdown(self.station_link(row))
+        with st.sidebar.expander("⚙️ Settings", expanded=True):
+            parameter = st.selectbox(
+                "Parameter", options=["temp_avg", "temp_min", "temp_max"]
             )
-            df = df.rename(columns={"temp_avg": "value"})
-            if datasource_id == 1:
-                cn = self.get_climate_normal(df)
-                df = self.add_diff_column(df, cn)
-                df = df.drop(["value"], axis=1)
-                df = df.rename(columns={"value_diff": "value"})
+            year = st.selectbox(
+                "Year", options=list(range(self.year_max, self.year_min - 1, -1))
+            )
+            smoothing = st.slider("Smoothing (± days)", 0, 15, 7)
+        bands = self.get_climatology(self.sel_station, parameter, smoothing)
+        days = self.year_index.select(self.data, [year, year])
+        days = days.set_index("day_of_year")[[parameter]]
+        # all days of the year, also those without values
+        dates = pd.date_range(f"{year}-01-01", f"{year}-12-31")
+        plot_df = bands.iloc[: len(dates)].join(days)
+        plot_df["date"] = dates
+        settings = {
+            "x": "date",
+            "y": parameter,
+            "y_title": self.parameter_titles[parameter],
+            "tooltip": ["date", parameter, "p50"],
+            "width": 1000,
+            "height": 400,
+            "title": f"{year} compared to the years {self.year_min}-{datetime.now().year - 1}",
+        }
+        plots.day_of_year_chart(plot_df.reset_index(), settings)
+        with st.expander("Show Data", expanded=False):
+            st.write(plot_df)
+
+    @st.experimental_memo
+    def get_spiral_data(
+        _self, stations: tuple, parameter: str, mode_id: int, period, rings: bool
+    ):
+        """Returns the monthly values (mode_id 0) or anomalies from the
+        climate normal of period (mode_id 1) of the stations with their
+        spiral coordinates, cached per station and mode.
 
+        With rings, the months are averaged per decade and each decade is a
+        ring of the spiral.
+        """
+        frames = []
+        for station in stations:
+            df = _self.get_rollups(station, "month")[["year", "month", parameter]]
+            if mode_id == 1:
+                normals = _self.get_climate_normals(station, period)
+                df = climate.anomalies(df, normals)
+                df = df.drop([parameter], axis=1)
+                df = df.rename(columns={f"{parameter}_anomaly": "value"})
+                df = df.dropna(subset=["value"])
+            else:
+                df = df.rename(columns={parameter: "value"})
             df = df[df["year"] < datetime.now().year]
-            df = df.sort_values(["year", "month"])
-            return df
+            frames.append(df.assign(station=station))
+        df = pd.concat(frames, ignore_index=True)
+        z = None
+        if rings:
+            df = (
+                df.assign(decade=df["year"] // 10 * 10)
+                .groupby(["station", "decade", "month"])["value"]
+                .mean()
+                .reset_index()
+            )
+            z = "decade"
+        df = df.sort_values(["station", z or "year", "month"], ignore_index=True)
+        min_value = np.floor(df["value"].min()) - 0.5
+        return spiral.coordinates(df, "value", min_value, z), min_value
 
+    def show_spiral(self, row):
         st.markdown(self.station_link(row))
         station = row.iloc[0]["station"]
         plot_options = [
             "Monthly average temperature",
-            "Difference from climate normal (< 1900)",
+            "Difference from climate normal",
         ]
         mode = st.radio(label="Show", options=plot_options)
         mode_id = plot_options.index(mode)
-        temperature_df = aggregate_data(self.data, mode_id)
-        min = np.floor(temperature_df["value"].min()) - 0.5
-        max = min + np.ceil(temperature_df["value"].max()) + 0.5
+        period_name, period = "", None
+        if mode_id == 1:
+            period_options = list(climate.PERIODS) + ["custom"]
+            period_name = st.selectbox("Reference period", options=period_options)
+            if period_name == "custom":
+                year_min, year_max = int(self.year_min), int(self.year_max)
+                period = st.slider(
+                    "Years of reference period",
+                    min_value=year_min,
+                    max_value=year_max,
+                    value=(year_min, min(year_min + 29, year_max)),
+                )
+                period_name = f"{period[0]}-{period[1]}"
+            else:
+                period = climate.PERIODS[period_name]
+        rings = st.checkbox("Decadal rings (average of each month per decade)")
+        stations = self.df_stations_full
+        names = dict(zip(stations["id"], stations["station"]))
+        other_stations = st.multiselect(
+            "Compare with stations",
+            options=[id for id in stations["id"] if id != self.sel_station],
+            format_func=lambda id: names[id],
+        )
+        sel_stations = (self.sel_station, *other_stations)
+        temperature_df, min_value = self.get_spiral_data(
+            sel_stations, self.parameter, mode_id, period, rings
+        )
         title = [
             f"Spiral View of average monthly temperature at {station}",
-            f"Spiral View of monthly temperature difference from preindustrial (<1900) climate normal at {station}",
+            f"Spiral View of monthly temperature difference from {period_name} climate normal at {station}",
         ]
-        settings = {"min": min, "max": max, "value": "value", "title": title[mode_id]}
-
+        settings = {
+            "min": min_value,
+            "value": "value",
+            "title": title[mode_id],
+            "hover": ["decade" if rings else "year", "month"],
+        }
+        if len(sel_stations) > 1:
+            settings["color"] = "station"
+            settings["hover"] = ["station"] + settings["hover"]
         plots.line_chart_3d(temperature_df, settings)
         with st.expander("Show Data", expanded=False):
-            st.table(temperature_df[["year", "month", "value"]])
+            st.table(temperature_df[settings["hover"] + ["value"]])
 
     def get_station(self):
         text = "Select a station"
@@ -508,42 +1029,51 @@ class NbcnBrowser:
         st.markdown(text)
 
     def predict(self):
-        fields = ["year", "month", "date", "temp_avg"]
-        df = self.data[fields]
-        if self.years != [self.year_min, self.year_max]:
-            df = df[(df["year"] >= self.years[0]) & (df["year"] <= self.years[1])]
-        df.columns = ["year", "month", "ds", "y"]
-        # create test dataset, remove last 12 month
-        train = df[df["year"] < datetime.now().year]
-        model = Prophet()
-        model.fit(train)
-        # define the period for which we want a prediction
-        start_predict = df["ds"].max() + timedelta(days=1)
-        end_predict = datetime(self.prediction_end_year, 12, 31)
-        future = pd.date_range(start=start_predict, end=end_predict, freq="D")
-        future = pd.DataFrame(future)
-        future.columns = ["ds"]
-        # use the model to make a forecast
-        forecast = model.predict(future)
-
-        forecast = forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]]
-
-        if self.resolution_options.index(self.resolution) == 0:
-            forecast = add_time_columns(forecast, "ds", ["year", "year_date"])
-            all_fields = ["year_date", "year", "yhat", "yhat_lower", "yhat_upper"]
-            forecast = (
-                forecast[all_fields]
-                .groupby(["year", "year_date"])
-                .agg("mean")
-                .reset_index()
-            )
-        elif self.resolution_options.index(self.resolution) == 1:
-            forecast = add_time_columns(forecast, "ds", ["year", "month_date"])
-            all_fields = ["month_date", "year", "yhat", "yhat_lower", "yhat_upper"]
-            forecast = (
-                forecast[all_fields]
-                .groupby(["year", "month_date"])
-                .agg("mean")
-                .reset_index()
+        """Returns the forecast of temp_avg up to prediction_end_year at the
+        selected resolution, made by the selected engine (see forecast.py).
+
+        Forecasts precomputed by forecast_batch.py are read from the store.
+        Otherwise the forecaster is fitted inline; fitted forecasters and
+        forecasts are cached on disk (see forecast_cache.py), a forecaster
+        is only fitted for new data or years.
+        """
+        df, year_index = self.resolution_data(self.resolution)
+        df = year_index.select(df, self.years)
+        watermark = forecast_cache.watermark(self.data["date"])
+        years = [int(year) for year in self.years]
+        result = forecast_batch.read(
+            self.sel_station,
+            self.forecast_engine,
+            self.resolution,
+            years,
+            watermark,
+            self.prediction_end_year,
+        )
+        if result is not None:
+            return self.format_forecast(result)
+        model_key = forecast_cache.key(
+            self.sel_station, self.forecast_engine, self.resolution, years, watermark
+        )
+        forecast_key = forecast_cache.key(model_key, self.prediction_end_year)
+        result = forecast_cache.cache.load_forecast(forecast_key)
+        if result is None:
+            forecaster_class = forecast.FORECASTERS[self.forecast_engine]
+            forecaster = forecast_cache.cache.load_model(model_key, forecaster_class)
+            if forecaster is None:
+                # train on complete years
+                train = df[df["year"] < datetime.now().year]
+                forecaster = forecaster_class().fit(
+                    train[self.x_var], train["temp_avg"], self.resolution
+                )
+                forecast_cache.cache.save_model(model_key, forecaster)
+            future = forecast.future_dates(
+                df[self.x_var].max(), self.prediction_end_year, self.resolution
             )
-        return forecast
+            result = forecaster.predict(future)
+            forecast_cache.cache.save_forecast(forecast_key, result)
+        return self.format_forecast(result)
+
+    def format_forecast(self, result: pd.DataFrame) -> pd.DataFrame:
+        result = result.rename(columns={"ds": self.x_var})
+        result.insert(1, "year", result[self.x_var].dt.year)
+        return result
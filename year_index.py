@@ -0,0 +1,29 @@
+"""Row offsets of the years in data sorted by date.
+
+With the offsets precomputed, selecting a range of years is a positional
+slice of the frame (no copy) instead of a boolean mask over all rows.
+"""
+import numpy as np
+import pandas as pd
+
+
+class YearIndex:
+    def __init__(self, years):
+        """Builds the index from the year column of data sorted by date."""
+        years = np.asarray(years)
+        if len(years) > 1 and np.any(years[1:] < years[:-1]):
+            raise ValueError("data must be sorted by date")
+        self.first = int(years[0]) if len(years) > 0 else 0
+        self.last = int(years[-1]) if len(years) > 0 else -1
+        # offsets[i] is the first row of year first + i, the last entry the end
+        self.offsets = np.searchsorted(years, np.arange(self.first, self.last + 2))
+
+    def slice(self, first_year: int, last_year: int) -> slice:
+        """Returns the rows of the years first_year to last_year (inclusive)."""
+        first = min(max(first_year, self.first), self.last + 1) - self.first
+        last = min(max(last_year, self.first - 1), self.last) - self.first
+        start = int(self.offsets[first])
+        return slice(start, max(start, int(self.offsets[last + 1])))
+
+    def select(self, df: pd.DataFrame, years: list) -> pd.DataFrame:
+        return df.iloc[self.slice(years[0], years[1])]